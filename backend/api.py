@@ -1,23 +1,83 @@
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+import asyncio
+import os
+from contextlib import asynccontextmanager
 
-from .src.main import search_stream
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 
+from .src.main import search_stream, make_prefetcher
+from .src.resource import dumps
+from .src.prefetch import PrefetchBudget
+from .src.metrics import render as render_metrics
+from .src.tracing import new_request_id, start_trace, finish_trace, get_trace
 
-app = FastAPI()
 
-async def event_stream(query: str):
-    async for source, resources in search_stream(query):
-        yield {
-            "source" : source,
-            "resources" : resources
-        }
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """With `PROPERLY_PREFETCH=1` popular topics are refreshed in the background."""
+    prefetch = None
+    if os.getenv("PROPERLY_PREFETCH") == "1":
+        prefetch = asyncio.create_task(make_prefetcher(PrefetchBudget.from_env()).run_forever())
+    yield
+    if prefetch:
+        prefetch.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Tracing is an admin feature: it is enabled only when this token is configured,
+# and a request opts in by sending it in the `X-Properly-Trace` header.
+TRACE_TOKEN = os.getenv("PROPERLY_TRACE_TOKEN")
+
+
+def trace_allowed(token: str | None) -> bool:
+    return bool(TRACE_TOKEN) and token == TRACE_TOKEN
+
+
+async def event_stream(query: str, fast: bool = False):
+    async for event in search_stream(query, fast=fast):
+        yield event
 
 @app.get("/search")
-async def search(query: str):
+async def search(query: str, fast: bool = False, x_properly_trace: str | None = Header(default=None)):
+    """
+    Stream results as they arrive, one JSON event per line.
+    With `fast=true` HN and Reddit results are sent before their links are checked,
+    followed by "update" events marking each of them live or dead.
+    """
+    request_id = new_request_id()
+    tracing = trace_allowed(x_properly_trace)
+
     async def stream():
-        async for item in event_stream(query):
-            yield (str(item) + "\n")
-    
-    return StreamingResponse(stream(), media_type="text/plain")
+        trace = start_trace(request_id, f"/search?query={query}") if tracing else None
+        try:
+            async for item in event_stream(query, fast):
+                yield dumps(item)
+        finally:
+            if trace:
+                finish_trace(trace)
+
+    headers = {"X-Request-ID": request_id}
+    if tracing:
+        headers["Link"] = f"</traces/{request_id}>; rel=\"trace\""
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers=headers)
+
+
+@app.get("/traces/{request_id}")
+def trace(request_id: str, x_properly_trace: str | None = Header(default=None)):
+    """Download the Chrome trace JSON captured for a traced search."""
+    if not trace_allowed(x_properly_trace):
+        raise HTTPException(status_code=403, detail="tracing is not enabled")
+    exported = get_trace(request_id)
+    if exported is None:
+        raise HTTPException(status_code=404, detail="no trace for this request (yet)")
+    return JSONResponse(
+        exported, headers={"Content-Disposition": f"attachment; filename=trace-{request_id}.json"}
+    )
+
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
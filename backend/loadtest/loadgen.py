@@ -0,0 +1,166 @@
+"""
+Load generator for the `/search` endpoint of `backend/api.py`.
+
+Simulates N concurrent users, each issuing a number of streamed searches, and reports
+per source the p50/p99 time until that source's first results arrive (one sample per
+request, however many events the source streams), together with overall
+time-to-first-result and time-to-complete. When the server pid is given, thread count
+and resident memory of the server are sampled from /proc (Linux only).
+
+Usage (from root folder, with the backend running against the stubs):
+    python -m backend.loadtest.loadgen --users 20 --requests 5 --server-pid $(pgrep -f "backend/api.py")
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import aiohttp
+
+
+DEFAULT_QUERIES = [
+    "machine learning", "linear algebra", "rust programming", "quantum computing",
+    "organic chemistry", "statistics", "compilers", "neuroscience", "astrophysics",
+]
+
+
+@dataclass
+class RunStats:
+    first_result: List[float] = field(default_factory=list)
+    complete: List[float] = field(default_factory=list)
+    per_source: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    errors: int = 0
+    threads: List[int] = field(default_factory=list)
+    rss_kb: List[int] = field(default_factory=list)
+
+
+def percentile(xs: Sequence[float], p: float) -> float:
+    """Nearest-rank percentile, p in [0, 100]."""
+    if not xs:
+        return float("nan")
+    ordered = sorted(xs)
+    rank = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def parse_event(line: str) -> Optional[dict]:
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+async def one_search(session: aiohttp.ClientSession, url: str, query: str, stats: RunStats, fast: bool = False) -> None:
+    start = time.perf_counter()
+    first: Optional[float] = None
+    per_source: Dict[str, float] = {}  # first event of each source
+    params = {"query": query, "fast": "true"} if fast else {"query": query}
+    try:
+        async with session.get(f"{url}/search", params=params) as response:
+            response.raise_for_status()
+            async for raw in response.content:
+                line = raw.decode().strip()
+                if not line or (event := parse_event(line)) is None:
+                    continue
+                elapsed = time.perf_counter() - start
+                if "resources" not in event:
+                    continue  # fast mode "update" events
+                if first is None and event["resources"]:
+                    first = elapsed
+                per_source.setdefault(event.get("source", "?"), elapsed)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        stats.errors += 1
+        return
+
+    stats.complete.append(time.perf_counter() - start)
+    for source, elapsed in per_source.items():
+        stats.per_source[source].append(elapsed)
+    if first is not None:
+        stats.first_result.append(first)
+
+
+async def user(session: aiohttp.ClientSession, url: str, queries: Sequence[str], n: int, stats: RunStats, fast: bool) -> None:
+    for _ in range(n):
+        await one_search(session, url, random.choice(queries), stats, fast)
+
+
+def read_proc_status(pid: int) -> Dict[str, int]:
+    """Return Threads and VmRSS (kB) from /proc/<pid>/status."""
+    out: Dict[str, int] = {}
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        key, _, value = line.partition(":")
+        if key in ("Threads", "VmRSS"):
+            out[key] = int(value.split()[0])
+    return out
+
+
+async def sample_server(pid: int, stats: RunStats, interval: float = 0.25) -> None:
+    while True:
+        try:
+            status = read_proc_status(pid)
+        except (FileNotFoundError, ProcessLookupError):
+            return
+        stats.threads.append(status.get("Threads", 0))
+        stats.rss_kb.append(status.get("VmRSS", 0))
+        await asyncio.sleep(interval)
+
+
+def report(stats: RunStats, wall: float) -> str:
+    def row(name: str, xs: Sequence[float]) -> str:
+        return f"{name:<22}{len(xs):>7}{percentile(xs, 50):>10.3f}{percentile(xs, 99):>10.3f}{max(xs, default=float('nan')):>10.3f}"
+
+    lines = [
+        f"{'':<22}{'count':>7}{'p50 (s)':>10}{'p99 (s)':>10}{'max (s)':>10}",
+        row("time to first result", stats.first_result),
+        row("time to complete", stats.complete),
+    ]
+    lines += [row(f"  {source}", xs) for source, xs in sorted(stats.per_source.items())]
+    lines.append(f"\nrequests: {len(stats.complete)} ok, {stats.errors} failed in {wall:.1f}s "
+                 f"({len(stats.complete) / wall:.2f} req/s)")
+    if stats.threads:
+        lines.append(f"server threads: peak {max(stats.threads)}, median {percentile(stats.threads, 50):.0f}")
+        lines.append(f"server RSS: peak {max(stats.rss_kb) / 1024:.1f} MiB, "
+                     f"median {percentile(stats.rss_kb, 50) / 1024:.1f} MiB")
+    return "\n".join(lines)
+
+
+async def run(url: str, users: int, requests: int, queries: Sequence[str], server_pid: Optional[int], timeout: float, fast: bool = False) -> RunStats:
+    stats = RunStats()
+    sampler = asyncio.create_task(sample_server(server_pid, stats)) if server_pid else None
+
+    connector = aiohttp.TCPConnector(limit=users)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        await asyncio.gather(*(user(session, url, queries, requests, stats, fast) for _ in range(users)))
+
+    if sampler:
+        sampler.cancel()
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Drive /search with concurrent users.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=5, help="searches per user")
+    parser.add_argument("--queries", type=Path, default=None, help="file with one query per line")
+    parser.add_argument("--server-pid", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=120.0, help="per search, in seconds")
+    parser.add_argument("--fast", action="store_true", help="use the progressive fast mode of /search")
+    args = parser.parse_args()
+
+    queries = args.queries.read_text().split("\n") if args.queries else DEFAULT_QUERIES
+    queries = [q.strip() for q in queries if q.strip()]
+
+    start = time.perf_counter()
+    stats = asyncio.run(run(args.url, args.users, args.requests, queries, args.server_pid, args.timeout, args.fast))
+    print(report(stats, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
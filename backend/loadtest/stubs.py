@@ -0,0 +1,353 @@
+"""
+Local stub upstreams for load testing the backend on a single machine.
+
+One aiohttp server impersonates every upstream the backend talks to:
+  - /algolia  Hacker News search (Algolia API)
+  - /wiki     Wikipedia search API
+  - /arxiv    arXiv Atom API
+  - /r, /comments, /api  Reddit OAuth API (PRAW joins absolute paths, so these live at the root)
+  - /res      a pool of fake "resource" pages with configurable liveness
+
+Responses are replayed from a recordings directory when one matches, otherwise
+they are synthesized deterministically from the query. Every upstream has its own
+latency and failure rate, so slow or flaky sources can be simulated one at a time.
+
+The backend reads every upstream base url from the environment, so that it can be
+pointed at these stubs: `ALGOLIA_API`, `WIKIPEDIA_API`, `ARXIV_API`, `REDDIT_URL` and
+`REDDIT_OAUTH_URL` (unset: the real upstreams). `--print-env` prints them for the stubs.
+
+Usage (from root folder):
+    python -m backend.loadtest.stubs --port 8090 --latency reddit=400 --failure wiki=0.05
+    eval "$(python -m backend.loadtest.stubs --port 8090 --print-env)"
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+from xml.sax.saxutils import escape
+
+from aiohttp import web
+
+
+UPSTREAMS = ("algolia", "wiki", "arxiv", "reddit", "res")
+
+
+@dataclass(frozen=True)
+class StubConfig:
+    """
+    - latency_ms: mean response latency per upstream (uniform jitter of +-50% is added)
+    - failure_rate: fraction of requests answered with a 503, per upstream
+    - live_ratio: fraction of the resource pool that answers with 200 (others 404)
+    - pool_size: number of distinct fake resource URLs
+    - recordings: optional directory with recorded responses (see `load_recording`)
+    """
+    host: str = "127.0.0.1"
+    port: int = 8090
+    latency_ms: Dict[str, float] = field(default_factory=lambda: {
+        "algolia": 150, "wiki": 80, "arxiv": 300, "reddit": 250, "res": 60
+    })
+    failure_rate: Dict[str, float] = field(default_factory=dict)
+    live_ratio: float = 0.8
+    pool_size: int = 500
+    recordings: Optional[Path] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+
+def seeded(*parts: object) -> random.Random:
+    """Deterministic RNG so that the same query always gets the same answer."""
+    digest = hashlib.sha256("|".join(map(str, parts)).encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "default"
+
+
+def load_recording(cfg: StubConfig, upstream: str, key: str) -> Optional[web.Response]:
+    """
+    Recorded responses live in `<recordings>/<upstream>/<slug of key>.json`, falling back
+    to `<recordings>/<upstream>/default.json`. Each file holds
+    `{"status": int, "content_type": str, "body": str | object}`.
+    """
+    if cfg.recordings is None:
+        return None
+    folder = cfg.recordings / upstream
+    for candidate in (folder / f"{slug(key)}.json", folder / "default.json"):
+        if candidate.is_file():
+            rec = json.loads(candidate.read_text())
+            body = rec.get("body", "")
+            return web.Response(
+                status=rec.get("status", 200),
+                text=body if isinstance(body, str) else json.dumps(body),
+                content_type=rec.get("content_type", "application/json"),
+            )
+    return None
+
+
+def resource_url(cfg: StubConfig, rng: random.Random) -> str:
+    return f"{cfg.base_url}/res/{rng.randrange(cfg.pool_size)}"
+
+
+def is_live(cfg: StubConfig, idx: int) -> bool:
+    return seeded("res", idx).random() < cfg.live_ratio
+
+
+def upstream_of(path: str) -> str:
+    prefix = path.strip("/").split("/", 1)[0]
+    return "reddit" if prefix in ("r", "comments", "api") else prefix
+
+
+@web.middleware
+async def inject_latency_and_failures(request: web.Request, handler):
+    """Delays every request by the upstream latency and fails a fraction of them."""
+    cfg: StubConfig = request.app["cfg"]
+    upstream = upstream_of(request.path)
+    mean = cfg.latency_ms.get(upstream, 0.0)
+    if mean > 0:
+        await asyncio.sleep(random.uniform(0.5 * mean, 1.5 * mean) / 1000)
+    if random.random() < cfg.failure_rate.get(upstream, 0.0):
+        return web.Response(status=503, text="injected failure")
+    return await handler(request)
+
+
+# --- Hacker News (Algolia) ---
+
+async def algolia_search(request: web.Request) -> web.Response:
+    cfg: StubConfig = request.app["cfg"]
+    query = request.query.get("query", "")
+    if (rec := load_recording(cfg, "algolia", query)) is not None:
+        return rec
+
+    rng = seeded("algolia", query)
+    n = int(request.query.get("hitsPerPage", 20))
+    hits = [
+        {
+            "objectID": str(rng.randrange(10**8)),
+            "title": f"{query} article {i}",
+            "url": resource_url(cfg, rng),
+            "points": rng.randrange(1, 1500),
+        }
+        for i in range(n)
+    ]
+    return web.json_response({"hits": hits, "nbHits": n, "hitsPerPage": n})
+
+
+# --- Wikipedia ---
+
+async def wiki_search(request: web.Request) -> web.Response:
+    cfg: StubConfig = request.app["cfg"]
+    term = request.query.get("srsearch", "")
+    if (rec := load_recording(cfg, "wiki", term)) is not None:
+        return rec
+
+    pageid = seeded("wiki", term).randrange(10**7)
+    return web.json_response({
+        "query": {"searchinfo": {}, "search": [{"pageid": pageid, "title": term.title()}]}
+    })
+
+
+# --- arXiv ---
+
+ATOM_ENTRY = """  <entry>
+    <id>http://arxiv.org/abs/{aid}v1</id>
+    <updated>2024-01-01T00:00:00Z</updated>
+    <published>2024-01-01T00:00:00Z</published>
+    <title>{title}</title>
+    <summary>{summary}</summary>
+    <author><name>Stub Author</name></author>
+    <link href="http://arxiv.org/abs/{aid}v1" rel="alternate" type="text/html"/>
+    <arxiv:primary_category term="cs.LG"/>
+    <category term="cs.LG"/>
+  </entry>"""
+
+ATOM_FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" xmlns:arxiv="http://arxiv.org/schemas/atom">
+  <opensearch:totalResults>{n}</opensearch:totalResults>
+  <opensearch:startIndex>0</opensearch:startIndex>
+  <opensearch:itemsPerPage>{n}</opensearch:itemsPerPage>
+{entries}
+</feed>"""
+
+
+async def arxiv_query(request: web.Request) -> web.Response:
+    cfg: StubConfig = request.app["cfg"]
+    query = request.query.get("search_query", "")
+    if (rec := load_recording(cfg, "arxiv", query)) is not None:
+        return rec
+
+    rng = seeded("arxiv", query)
+    n = min(int(request.query.get("max_results", 5)), 50)
+    entries = "\n".join(
+        ATOM_ENTRY.format(
+            aid=f"{rng.randrange(2000, 2500)}.{rng.randrange(10000, 99999)}",
+            title=escape(f"On {query} ({i})"),
+            summary=escape(f"We study {query}. " * 20),
+        )
+        for i in range(n)
+    )
+    return web.Response(text=ATOM_FEED.format(n=n, entries=entries), content_type="application/atom+xml")
+
+
+# --- Reddit ---
+
+async def reddit_token(request: web.Request) -> web.Response:
+    return web.json_response({
+        "access_token": "stub-token", "token_type": "bearer", "expires_in": 86400, "scope": "*"
+    })
+
+
+def listing(children: List[dict]) -> dict:
+    return {
+        "kind": "Listing",
+        "data": {"children": children, "after": None, "before": None, "dist": len(children)},
+    }
+
+
+def submission(sub: str, post_id: str, title: str, rng: random.Random) -> dict:
+    return {
+        "kind": "t3",
+        "data": {
+            "id": post_id, "name": f"t3_{post_id}", "subreddit": sub, "title": title,
+            "selftext": f"{title}. Please share resources.", "score": rng.randrange(1, 5000),
+            "num_comments": 20, "author": "stub_user", "created_utc": 1700000000.0,
+            "permalink": f"/r/{sub}/comments/{post_id}/", "url": f"https://www.reddit.com/r/{sub}/comments/{post_id}/",
+        },
+    }
+
+
+async def reddit_search(request: web.Request) -> web.Response:
+    cfg: StubConfig = request.app["cfg"]
+    sub = request.match_info["sub"]
+    query = request.query.get("q", "")
+    if (rec := load_recording(cfg, "reddit", f"search {sub} {query}")) is not None:
+        return rec
+
+    rng = seeded("reddit", sub, query)
+    n = min(int(request.query.get("limit", 10)), 100)
+    posts = [
+        submission(sub, f"{rng.randrange(36**6):06x}", f"{query} thread {i}", rng)
+        for i in range(n)
+    ]
+    return web.json_response(listing(posts))
+
+
+async def reddit_comments(request: web.Request) -> web.Response:
+    cfg: StubConfig = request.app["cfg"]
+    post_id = request.match_info["post_id"]
+    if (rec := load_recording(cfg, "reddit", f"comments {post_id}")) is not None:
+        return rec
+
+    rng = seeded("comments", post_id)
+    comments = [
+        {
+            "kind": "t1",
+            "data": {
+                "id": f"c{post_id}{i}", "name": f"t1_c{post_id}{i}", "link_id": f"t3_{post_id}",
+                "parent_id": f"t3_{post_id}", "subreddit": "stub", "author": "stub_user",
+                "score": rng.randrange(-5, 500), "replies": "",
+                "body": " and ".join(f"see {resource_url(cfg, rng)}" for _ in range(rng.randrange(0, 4))),
+            },
+        }
+        for i in range(20)
+    ]
+    post = submission("stub", post_id, "stub thread", rng)
+    return web.json_response([listing([post]), listing(comments)])
+
+
+# --- Resource pool ---
+
+RESOURCE_PAGE = """<html><head><title>Resource {idx}</title>
+<meta name="description" content="Stub resource number {idx}, a great place to learn."></head>
+<body><p>Stub resource number {idx}.</p></body></html>"""
+
+
+async def resource(request: web.Request) -> web.Response:
+    cfg: StubConfig = request.app["cfg"]
+    idx = int(request.match_info["idx"])
+    if not is_live(cfg, idx):
+        return web.Response(status=404, text="dead link")
+    return web.Response(text=RESOURCE_PAGE.format(idx=idx), content_type="text/html")
+
+
+def make_app(cfg: StubConfig) -> web.Application:
+    app = web.Application(middlewares=[inject_latency_and_failures])
+    app["cfg"] = cfg
+    app.router.add_get("/algolia/api/v1/search", algolia_search)
+    app.router.add_get("/wiki/w/api.php", wiki_search)
+    app.router.add_get("/arxiv/api/query", arxiv_query)
+    app.router.add_post("/api/v1/access_token", reddit_token)
+    app.router.add_get("/r/{sub}/search/", reddit_search)
+    app.router.add_get("/comments/{post_id}/", reddit_comments)
+    app.router.add_get("/res/{idx:\\d+}", resource)  # also answers HEAD
+    return app
+
+
+def stub_env(cfg: StubConfig) -> Dict[str, str]:
+    """Environment variables that point the backend at the stubs."""
+    base = cfg.base_url
+    return {
+        "ALGOLIA_API": f"{base}/algolia/api/v1",
+        "WIKIPEDIA_API": f"{base}/wiki/w/api.php",
+        "ARXIV_API": f"{base}/arxiv/api/query",
+        "REDDIT_OAUTH_URL": base,
+        "REDDIT_URL": base,
+        "REDDIT_CLIENT_ID": "stub",
+        "REDDIT_CLIENT_SECRET": "stub",
+        "REDDIT_USER_AGENT": "properly-loadtest",
+    }
+
+
+def parse_per_upstream(pairs: List[str], defaults: Dict[str, float]) -> Dict[str, float]:
+    """Parse `upstream=value` pairs, `all=value` applies to every upstream."""
+    out = dict(defaults)
+    for pair in pairs:
+        name, _, value = pair.partition("=")
+        names = UPSTREAMS if name == "all" else (name,)
+        for n in names:
+            if n not in UPSTREAMS:
+                raise SystemExit(f"unknown upstream {n!r}, expected one of {UPSTREAMS}")
+            out[n] = float(value)
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stub upstreams for load testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", nargs="*", default=[], metavar="UPSTREAM=MS")
+    parser.add_argument("--failure", nargs="*", default=[], metavar="UPSTREAM=RATE")
+    parser.add_argument("--live-ratio", type=float, default=0.8)
+    parser.add_argument("--pool-size", type=int, default=500)
+    parser.add_argument("--recordings", type=Path, default=None)
+    parser.add_argument("--print-env", action="store_true", help="print shell exports and exit")
+    args = parser.parse_args()
+
+    cfg = StubConfig(
+        host=args.host,
+        port=args.port,
+        latency_ms=parse_per_upstream(args.latency, StubConfig().latency_ms),
+        failure_rate=parse_per_upstream(args.failure, {}),
+        live_ratio=args.live_ratio,
+        pool_size=args.pool_size,
+        recordings=args.recordings,
+    )
+    if args.print_env:
+        for key, value in stub_env(cfg).items():
+            print(f"export {key}={value}")
+        return
+
+    print(f"Stub upstreams listening on {cfg.base_url} (started {time.strftime('%X')})")
+    web.run_app(make_app(cfg), host=cfg.host, port=cfg.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
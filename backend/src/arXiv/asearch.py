@@ -1,21 +1,23 @@
-from dataclasses import dataclass, field
-from typing import Optional, Iterable
+from typing import Iterable
 import arxiv
+import os
+import requests
 
+from ..metrics import span
+from ..breaker import guard, sources
+from ..policy import RETRYABLE_STATUS
+from ..resource import Resource
 
-@dataclass(frozen=True)
-class ArxivResource:
-    title: str
-    url: str
-    description: Optional[str]
-    source: str = field(default="arxiv")
 
-    def __eq__(self, other):
-        return self.url == other.url
-    
-    def __hash__(self):
-        return hash(self.url)
-    
+ARXIV_API = os.getenv("ARXIV_API")  # see backend/loadtest/stubs.py
+
+
+def unavailable(e: BaseException) -> bool:
+    """Errors that count against the arXiv breaker (arXiv answers empty pages when overloaded)."""
+    if isinstance(e, arxiv.HTTPError):
+        return e.status in RETRYABLE_STATUS
+    return isinstance(e, (arxiv.UnexpectedEmptyPageError, requests.ConnectionError, requests.Timeout))
+
 
 def deduplicate(xs: Iterable) -> Iterable:
     """Ensures results are unique"""
@@ -32,23 +34,30 @@ def mk_description(abstract: str, length: int) -> str:
     return abstract[:length] + "..."
 
 
-def search_arxiv(query: str, n: int = 5) -> Iterable[ArxivResource]:
-    """Searches arXiv and yields `n` ArxivResource, ordered by relevance."""
+def search_arxiv(query: str, n: int = 5) -> Iterable[Resource]:
+    """Searches arXiv and yields `n` resources, ordered by relevance."""
 
     client:      arxiv.Client = arxiv.Client()
+    if ARXIV_API:
+        client.query_url_format = ARXIV_API + "?{}"
     search_call: arxiv.Search = arxiv.Search(
         query=query, max_results=n, sort_by=arxiv.SortCriterion.Relevance
     )
 
-    for res in client.results(search_call):
-        yield ArxivResource(
+    # a single page holds all `n` results, fetch it eagerly so that it can be timed
+    with span("arxiv", "upstream"), guard(sources.get("arxiv"), "arxiv", unavailable):
+        results = list(client.results(search_call))
+
+    for res in results:
+        yield Resource(
+            source="arxiv",
             title=res.title.strip(),
             url=res.entry_id,
             description=mk_description(res.summary.strip(), 200) if res.summary else "(No description)"
         )
 
 
-def get_resources(query: str, n: int = 5) -> Iterable[ArxivResource]:
+def get_resources(query: str, n: int = 5) -> Iterable[Resource]:
     return deduplicate(search_arxiv(query=query, n=n))
 
 
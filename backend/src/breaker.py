@@ -0,0 +1,149 @@
+"""
+Circuit breakers for upstream sources and for the hosts of checked links.
+
+After `threshold` consecutive failures a breaker opens: calls fail fast, without
+waiting out timeouts, for `reset_after` seconds. Then it is half-open: a single
+trial call goes through; its success closes the breaker, its failure opens it
+again for another `reset_after` seconds.
+
+`sources` is keyed by upstream ("wiki", "hn" for Algolia, "reddit", "arxiv"),
+`hosts` by the hostname of liveness and meta fetches. A link whose host is not
+contacted is neither live nor dead: liveness checks report it as unknown (None),
+and nothing is cached, deleted or shown as dead on that.
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+from urllib.parse import urlparse
+
+from prometheus_client import Counter
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+BREAKER_TRANSITIONS = Counter(
+    "properly_breaker_transitions_total", "Circuit breaker state changes", ["kind", "state"],
+)
+BREAKER_REJECTIONS = Counter(
+    "properly_breaker_rejections_total", "Calls failed fast by an open circuit breaker", ["kind"],
+)
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Thread-safe breaker counting consecutive failures."""
+
+    def __init__(self, kind: str, threshold: int, reset_after: float) -> None:
+        self.kind = kind
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial = False   # a half-open trial call is in flight
+        self._lock = threading.Lock()
+
+
+    def is_open(self) -> bool:
+        """Open and not yet due for a trial; does not change the state."""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self._opened_at < self.reset_after
+
+
+    def allow(self) -> bool:
+        """Whether a call may go through now; past `reset_after` it becomes the half-open trial."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_after:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED or (self.state == HALF_OPEN and not self._trial):
+                self._trial = self.state == HALF_OPEN
+                return True
+        BREAKER_REJECTIONS.labels(self.kind).inc()
+        return False
+
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._trial = False
+            if ok:
+                self._failures = 0
+                if self.state != CLOSED:
+                    self._transition(CLOSED)
+                return
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                if self.state != OPEN:
+                    self._transition(OPEN)
+
+
+    def release(self) -> None:
+        """Give up a call without an outcome."""
+        with self._lock:
+            self._trial = False
+
+
+    def _transition(self, state: str) -> None:
+        """Caller holds the lock."""
+        self.state = state
+        BREAKER_TRANSITIONS.labels(self.kind, state).inc()
+
+
+class Breakers:
+    """One breaker per key, created on first use; at most `max_keys` are kept (least recently used out)."""
+
+    def __init__(self, kind: str, threshold: int, reset_after: float, max_keys: int = 4096) -> None:
+        self.kind = kind
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.max_keys = max_keys
+        self._breakers: "OrderedDict[str, CircuitBreaker]" = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(self.kind, self.threshold, self.reset_after)
+                while len(self._breakers) > self.max_keys:
+                    self._breakers.popitem(last=False)
+            self._breakers.move_to_end(key)
+            return breaker
+
+
+    def for_url(self, url: str) -> Optional[CircuitBreaker]:
+        host = urlparse(url).hostname
+        return self.get(host) if host else None
+
+
+sources = Breakers("source", threshold=5, reset_after=30.0)
+hosts = Breakers("host", threshold=3, reset_after=60.0)
+
+
+@contextmanager
+def guard(breaker: CircuitBreaker, name: str, unavailable: Callable[[BaseException], bool]) -> Iterator[None]:
+    """
+    Fail fast with `CircuitOpen` while the breaker is open, record the outcome otherwise.
+    Only errors that `unavailable` says are about the upstream's availability count as
+    failures; others (a 404, a private subreddit) say nothing about it.
+    """
+    if not breaker.allow():
+        raise CircuitOpen(f"{name} is failing, circuit open")
+    try:
+        yield
+    except Exception as e:
+        if unavailable(e):
+            breaker.record(False)
+        else:
+            breaker.release()
+        raise
+    except BaseException:
+        # cancelled: says nothing about the upstream
+        breaker.release()
+        raise
+    breaker.record(True)
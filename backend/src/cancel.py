@@ -0,0 +1,21 @@
+"""
+Cooperative cancellation of the blocking work of a search.
+
+Cancelling an asyncio task does not stop the threads it started (`asyncio.to_thread`,
+thread pools): without help, a search superseded by a newer query would keep checking
+links and fetching pages to the end. A search hands a `threading.Event` to its blocking
+fan-outs and sets it when it ends; their work items call `check` before starting, so
+what is still queued is dropped with `Cancelled` instead of hitting upstreams.
+"""
+import threading
+from typing import Optional
+
+
+class Cancelled(Exception):
+    pass
+
+
+def check(stop: Optional[threading.Event]) -> None:
+    """Raise `Cancelled` once `stop` is set."""
+    if stop is not None and stop.is_set():
+        raise Cancelled("search cancelled")
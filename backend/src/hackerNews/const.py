@@ -1,5 +1,8 @@
-ALGOLIA_SEARCH_URL = "https://hn.algolia.com/api/v1/search"
-ALGOLIA_SEARCH_BY_DATE = "https://hn.algolia.com/api/v1/search_by_date"
+import os
+
+ALGOLIA_API = os.getenv("ALGOLIA_API", "https://hn.algolia.com/api/v1")  # see backend/loadtest/stubs.py
+ALGOLIA_SEARCH_URL = f"{ALGOLIA_API}/search"
+ALGOLIA_SEARCH_BY_DATE = f"{ALGOLIA_API}/search_by_date"
 
 import re
-URL_RE = re.compile(r"(https?://[^\s)>\]]+)", re.IGNORECASE)
\ No newline at end of file
+URL_RE = re.compile(r"(https?://[^\s)>\]]+)", re.IGNORECASE)
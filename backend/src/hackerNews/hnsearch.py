@@ -1,40 +1,55 @@
+import threading
 from typing import Dict, Optional, List
 from collections import OrderedDict
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from dataclasses import replace
+import numpy as np
 import requests
 
 # internal lib
 from .const import ALGOLIA_SEARCH_URL
-from .lib import filter_live_urls, get_meta_bulk
+from .lib import check_live_urls, get_meta_bulk
+from ..metrics import span, record_liveness, SOURCE_ERRORS
+from ..tracing import traced, propagate
+from ..policy import call, DeadlineExceeded, RETRYABLE_STATUS
+from ..reddit.embeddings import shared_index
+from ..resource import Resource
 
+# Weights of the ranking score: semantic similarity of the title to the query,
+# and popularity (log of the Algolia points, normalized over the candidates).
+W_SIMILARITY = 0.8
+W_POINTS = 0.2
 
-@dataclass(frozen=True)
-class HackerNewsResource:
-    title : str
-    url : str
-    description: Optional[str]
 
-    def __eq__(self, other):
-        return self.url == other.url
-    
-    def __hash__(self):
-        return hash(self.url)
+def transient(e: BaseException) -> bool:
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and e.response.status_code in RETRYABLE_STATUS
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
 
 
-def get_json(url: str, params: Optional[Dict] = None, timeout: int = 6) -> Optional[Dict]:
-    """Small and reusable http helper for single requests.
+def get_json(url: str, params: Optional[Dict] = None) -> Optional[Dict]:
+    """Small and reusable http helper for single requests,
+    with the deadline, retries and hedging of the "hn" request policy.
     """
+    def attempt(timeout: float) -> Dict:
+        with traced("GET", "http", host=urlparse(url).hostname) as sp:
+            r = requests.get(url, params=params, timeout=timeout)
+            sp.set("status", r.status_code)
+            r.raise_for_status()
+            return r.json()
+
     try:
-        r = requests.get(url, params=params, timeout=timeout)
-        r.raise_for_status()
-        return r.json()
-    except requests.RequestException as e:
+        with span("hn", "upstream"):
+            return call("hn", attempt, transient)
+    except (requests.RequestException, DeadlineExceeded) as e:
         # debug
         print(f"While extracting json: {e}")
+        SOURCE_ERRORS.labels("hn").inc()
         return None
 
 
-def search_hn(query: str, hits: int = 50) -> List[HackerNewsResource]:
+def search_hn(query: str, hits: int = 50) -> List[Resource]:
     """
     Search HN stories via Algolia and return structured results:
     - title
@@ -51,60 +66,100 @@ def search_hn(query: str, hits: int = 50) -> List[HackerNewsResource]:
     if not js or "hits" not in js:
         return []
 
-    resources : List[HackerNewsResource] = []
+    resources : List[Resource] = []
     for hit in js["hits"]:
         url   = hit.get("url")
         title = hit.get("title")
         if url and url.startswith("http"):
+            # until ranked, the score is the Algolia points; links are not checked yet
             resources.append(
-                HackerNewsResource(title=title, url=url, description = None)
+                Resource("hn", title, url, score=hit.get("points") or 0, verified=False)
             )
     return resources
 
 
-def get_resources(query: str, hits: int = 50, max_workers: int = 30, timeout: int = 3, include_meta: bool = False) -> List[HackerNewsResource]:
+def search_variants(query: str, hits: int) -> List[Resource]:
+    """
+    Run the query variants concurrently and merge them, without duplicates:
+    "Learn {query}" hits first, then the (more specialized) plain query hits.
     """
-    Entry point for HN search:
-      - search HN for relevant results
-      - filter live links in parallel
+    variants = [f"Learn {query}", query]
+    with ThreadPoolExecutor(max_workers=len(variants)) as executor:
+        results = list(executor.map(propagate(lambda q: search_hn(q, hits)), variants))
+    return list(OrderedDict.fromkeys(r for rs in results for r in rs))
 
-    If `include_meta` is True, also a description of the link is fetched:
-    with my (not so powerful) machine, with 50 hits, this will cost around
-    2-3 seconds more (on 5 seconds) then the same fetch without meta fetch. I would
-    say that computational time increases by 50% more or less.
 
-    TODO: semanitc scoring when extracting posts.
+def rank(query: str, resources: List[Resource]) -> List[Resource]:
     """
-    learn_query = f"Learn {query}"
-    resources: List[HackerNewsResource] = search_hn(learn_query, hits)
-    if (n := len(resources)) < hits:
-        resources.extend(search_hn(query, hits-n)) # these articles should be more specialized
+    Score every candidate in one vectorized pass and sort them, best first.
+    The similarity is between the query and the title embeddings (a single batched encode call).
+    """
+    if not resources:
+        return []
+    embeddings = shared_index().encode([query] + [r.title or "" for r in resources])
+    similarity = embeddings[1:] @ embeddings[0]
+
+    points = np.log1p(np.array([r.score or 0 for r in resources], dtype=np.float32))
+    popularity = points / points.max() if points.max() > 0 else points
+
+    scores = W_SIMILARITY * similarity + W_POINTS * popularity
+    return [replace(resources[i], score=float(scores[i])) for i in np.argsort(-scores, kind="stable")]
 
+
+def verify_top(ranked: List[Resource], top_k: int, timeout: int, max_workers: int, stop: Optional[threading.Event] = None) -> List[Resource]:
+    """
+    Liveness-check candidates in rank order, in waves just large enough to fill `top_k`
+    slots, so dead links cost a few extra probes instead of probing every candidate.
+    """
+    live: List[Resource] = []
+    cursor = 0
+    while len(live) < top_k and cursor < len(ranked):
+        wave = ranked[cursor:cursor + top_k - len(live)]
+        cursor += len(wave)
+        checked = check_live_urls([r.url for r in wave], timeout=timeout, max_workers=max_workers, stop=stop)
+        record_liveness("hn", checked.values())
+        live.extend(replace(r, verified=True) for r in wave if checked[r.url])
+    return live
+
+
+def get_resources(query: str, hits: int = 30, top_k: int = 10, max_workers: int = 30, timeout: int = 3, include_meta: bool = False, verify: bool = True, stop: Optional[threading.Event] = None) -> List[Resource]:
+    """
+    Entry point for HN search, rank first and verify only what is displayed:
+      - search HN for "Learn {query}" and for the plain query, concurrently (`hits` each)
+      - rank the candidates by title similarity to the query and by points
+      - liveness-check the best ones until `top_k` live links are found
+
+    If `include_meta` is True, also a description of the link is fetched, for the
+    `top_k` live links only.
+    With `verify=False` the `top_k` best candidates are returned as they are, unchecked.
+    Once `stop` is set, the checks and fetches not yet started are dropped (see `cancel.py`).
+    """
+    resources: List[Resource] = search_variants(query, hits)
     if not resources:
         return []
 
-    live_urls = filter_live_urls([r.url for r in resources], timeout=timeout, max_workers=max_workers)
-    live_resources = [r for r in resources if r.url in live_urls]
-    live_resources = list(OrderedDict.fromkeys(live_resources))
+    with span("hn", "embedding"):
+        ranked = rank(query, resources)
+
+    if not verify:
+        return ranked[:top_k]
+
+    with span("hn", "liveness"):
+        live_resources = verify_top(ranked, top_k, timeout=timeout, max_workers=max_workers, stop=stop)
 
     if include_meta:
-        meta = get_meta_bulk([r.url for r in live_resources])
+        with span("hn", "meta"):
+            meta = get_meta_bulk([r.url for r in live_resources], stop=stop)
     else:
         meta = {}
 
-    enriched = [
-        HackerNewsResource(
-            title = r.title, url = r.url,
-            description = meta.get(r.url) if include_meta else None
-        ) for r in live_resources
-    ]
-    return enriched
+    return [replace(r, description=meta.get(r.url)) for r in live_resources]
 
 
 
 if __name__ == "__main__":
     q = input("Search Hacker News for: ")
-    resources = get_resources(q, hits=40, max_workers=10)
+    resources = get_resources(q, hits=40, max_workers=10, include_meta=True)
     print("\nFound resources:\n")
     for r in resources:
         print(f"{r.title}\n{r.url}\n{r.description or '(no description)'}\n")
\ No newline at end of file
@@ -1,40 +1,71 @@
 import requests
+import threading
 from bs4 import BeautifulSoup
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Iterable, Set, Optional, Dict, Tuple
+from urllib.parse import urlparse
+
+from ..tracing import traced, propagate
+from ..breaker import hosts
+from ..cancel import check
     
 
-def check_url(url: str, timeout: int = 3) -> bool:
+def check_url(url: str, timeout: int = 3) -> Optional[bool]:
     """
     Return True if URL responds with <400 status.
     In this case we assume the link is not dead.
+    None when unknown, the host's circuit breaker being open (see `breaker.py`).
     """
+    breaker = hosts.for_url(url)
+    if breaker is None:
+        return False
+    if not breaker.allow():
+        return None
     try:
-        with requests.get(url, stream=True, timeout=timeout, allow_redirects=True) as r:
-            return r.status_code < 400
+        with traced("GET", "http", host=urlparse(url).hostname, purpose="liveness") as sp:
+            with requests.get(url, stream=True, timeout=timeout, allow_redirects=True) as r:
+                sp.set("status", r.status_code)
+                breaker.record(True)
+                return r.status_code < 400
+    except (requests.ConnectionError, requests.Timeout):
+        breaker.record(False)
+        return False
     except requests.RequestException:
+        breaker.release()
         return False
 
 
-def filter_live_urls(urls: Iterable[str], timeout: int = 3, max_workers: int = 10) -> Set[str]:
-    """Filter URLs, keeping only live ones. Returns a set of live URLs.
-    Pure functional approach: maps urls -> liveness check -> filter.
-    Uses parallel execution for performance.
+def check_live_urls(urls: Iterable[str], timeout: int = 3, max_workers: int = 10, stop: Optional[threading.Event] = None) -> Dict[str, Optional[bool]]:
+    """Check URLs in parallel: {url: live, dead (False) or unknown (None)}, see `check_url`.
+    Once `stop` is set, checks not yet started are dropped and `Cancelled` is raised.
     """
-    def is_live(url: str) -> tuple[str, bool]:
+    def is_live(url: str) -> Tuple[str, Optional[bool]]:
+        check(stop)
         return (url, check_url(url, timeout))
     
+    work = propagate(is_live)
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(is_live, url): url for url in urls}
-        return {url for future in as_completed(futures) 
-                if (result := future.result()) and result[1]
-                for url in [result[0]]}
+        futures = [executor.submit(work, url) for url in urls]
+        return dict(future.result() for future in as_completed(futures))
+
+
+def filter_live_urls(urls: Iterable[str], timeout: int = 3, max_workers: int = 10, stop: Optional[threading.Event] = None) -> Set[str]:
+    """Filter URLs, keeping only live ones. Returns a set of live URLs.
+    Pure functional approach: maps urls -> liveness check -> filter.
+    """
+    return {url for url, live in check_live_urls(urls, timeout, max_workers, stop).items() if live}
     
 
 def get_meta(url: str, timeout: int = 3) -> Optional[str]:
     """Try to extract a short meta description from the target page."""
+    breaker = hosts.for_url(url)
+    if breaker is None or not breaker.allow():
+        return None
     try:
-        r = requests.get(url, timeout=timeout, headers={"User-Agent": "Mozilla/5.0"})
+        with traced("GET", "http", host=urlparse(url).hostname, purpose="meta") as sp:
+            r = requests.get(url, timeout=timeout, headers={"User-Agent": "Mozilla/5.0"})
+            sp.set("status", r.status_code)
+        breaker.record(True)
         r.raise_for_status()
         soup = BeautifulSoup(r.text, "html.parser")
 
@@ -48,23 +79,29 @@ def get_meta(url: str, timeout: int = 3) -> Optional[str]:
             text = " ".join(p.get_text().strip().split()[:50])
             return text
 
+        return None
+    except (requests.ConnectionError, requests.Timeout):
+        breaker.record(False)
         return None
     except requests.RequestException:
+        breaker.release()
         return None
     
 
-def get_meta_bulk(urls: Iterable[str], timeout: int = 3, max_workers : int = 10) -> Dict[str, Optional[str]]:
+def get_meta_bulk(urls: Iterable[str], timeout: int = 3, max_workers : int = 10, stop: Optional[threading.Event] = None) -> Dict[str, Optional[str]]:
     """
     Fetch meta descriptions for multiple URLs in parallel.
-    Returns {url: description or None}.
+    Returns {url: description or None}; see `check_live_urls` for `stop`.
     """
 
     def fetch(u: str) -> Tuple[str, Optional[str]]:
+        check(stop)
         return (u, get_meta(u, timeout))
     
     results : Dict[str, Optional[str]] = {}
+    work = propagate(fetch)
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(fetch, url): url for url in urls}
+        futures = {executor.submit(work, url): url for url in urls}
         for future in as_completed(futures):
             url, desc = future.result()
             results[url] = desc
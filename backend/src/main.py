@@ -1,79 +1,254 @@
+import argparse
 import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
 
 # internal modules
+from .metrics import (
+    FIRST_EVENT_SECONDS, REQUEST_SECONDS, INFLIGHT_REQUESTS, INFLIGHT_SOURCES,
+    PHASE_SECONDS, SOURCE_ERRORS, record_cache, record_liveness, span
+)
 from .wikiMedia.wsearch import wikipedia_search
 from .reddit.rsearch import get_all_resources as reddit_search
 from .hackerNews.hnsearch import get_resources as hn_search
 from .arXiv.asearch import get_resources as arxiv_search
+from .hackerNews.lib import check_live_urls as hn_check_urls, get_meta_bulk
+from .reddit.lib import check_live_urls as reddit_check_urls
+from .store import ResourceStore
+from .resource import Resource
+from .breaker import CircuitOpen, sources as breakers
+from .prefetch import Prefetcher, PrefetchBudget
+from .tracing import propagate
+
+
+store = ResourceStore()
+# the store has threads of its own: its sub-millisecond lookups must not queue behind
+# the blocking sources on the default executor, and its writes are serialized anyway
+store_reads = ThreadPoolExecutor(max_workers=2, thread_name_prefix="store-read")
+store_writes = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store-write")
+
+LABELS = {
+    "local": "Recently verified",
+    "wiki": "WikiMedia",
+    "reddit": "Reddit",
+    "hn": "HackerNews",
+    "arxiv": "arXiv",
+}
 
 
 async def stream_arxiv(query: str, n: int):
-    loop = asyncio.get_running_loop()
-    gen = await loop.run_in_executor(None, lambda: arxiv_search(query, n))
+    # arxiv_search is a lazy generator: consume it in the worker thread,
+    # otherwise the HTTP call would block the event loop
+    items = await asyncio.to_thread(lambda: list(arxiv_search(query, n)))
 
-    for item in gen:
+    for item in items:
         yield item
 
 
-async def search_stream(query: str):
-    """Async generator yielding partial results as they arrive.
+async def search_store(query: str) -> List[Resource]:
+    return await asyncio.get_running_loop().run_in_executor(store_reads, propagate(store.search), query)
+
+
+def persist(write: Callable[..., None], *args: Any) -> None:
+    """Run a store write in the background, the stream doesn't wait for it; failures are logged."""
+    def logged(f: "Future[None]") -> None:
+        if f.exception() is not None:
+            print(f"Store write {write.__name__} failed: {f.exception()!r}")
+    store_writes.submit(write, *args).add_done_callback(logged)
+
+
+@dataclass(frozen=True)
+class Verification:
+    """Fast mode: outcome of checking candidates that were already streamed unverified."""
+    live: List[Resource]
+    dead: List[str]
+
+
+async def stream_unverified(source: str, candidates: Callable[[], Any], check: Callable[[List[str]], Dict[str, Optional[bool]]], describe: bool, stop: threading.Event):
     """
-    
-    wiki_task = asyncio.create_task(
-        wikipedia_search(query))
-    
-    reddit_task = asyncio.create_task(
-        asyncio.to_thread(reddit_search, query, 2, 2))
-    
-    hn_task = asyncio.create_task(
-        asyncio.to_thread(hn_search, query, hits=10, include_meta=True))
-    
-    arxiv_gen = stream_arxiv(query, 5)
-    arxiv_task = asyncio.create_task(arxiv_gen.__anext__())
+    Fast mode for sources that verify links: yield the raw candidates straight away,
+    then a `Verification` once liveness is known and, if `describe`, another one
+    carrying descriptions once they are fetched.
+    Links of unknown liveness (their host's circuit breaker is open) are in neither list.
+    """
+    result = await asyncio.to_thread(candidates)
+    yield result
+
+    resources = as_list(result)
+
+    urls = list(dict.fromkeys(r.url for r in resources))
+    with span(source, "liveness"):
+        checked = await asyncio.to_thread(check, urls)
+    live_resources = [replace(r, verified=True) for r in resources if checked.get(r.url)]
+    record_liveness(source, checked.values())
+    yield Verification(live_resources, [u for u in urls if checked.get(u) is False])
+
+    if describe and live_resources:
+        with span(source, "meta"):
+            meta = await asyncio.to_thread(get_meta_bulk, [r.url for r in live_resources], stop=stop)
+        yield Verification([replace(r, description=meta.get(r.url)) for r in live_resources], [])
+
+
+def as_list(result: Union[None, Resource, List[Resource]]) -> List[Resource]:
+    """Sources return a list of resources, a single one (wiki, each arxiv event) or None."""
+    if result is None:
+        return []
+    if isinstance(result, Resource):
+        return [result]
+    return result
+
+
+def as_updates(verification: Verification) -> List[Dict[str, Any]]:
+    return [
+        {"url": r.url, "live": True, "description": r.description} for r in verification.live
+    ] + [
+        {"url": url, "live": False, "description": None} for url in verification.dead
+    ]
+
 
+async def search_stream(query: str, background: bool = False, fast: bool = False):
+    """Async generator yielding events as results arrive:
+      - {"type": "results", "source", "resources"}: a batch of `Resource`
+      - {"type": "update", "source", "updates"}: fast mode only, verification of resources
+        streamed with `verified=False`: [{"url", "live", "description"}]
+      - {"type": "degraded", "source"}: the source is failing (its circuit breaker is open)
+        and was skipped
+
+    In `fast` mode HN and Reddit candidates are streamed before their links are checked.
+    `background` searches (prefetches) don't count as user demand, nor in the request metrics.
+    """
+    start = time.perf_counter()
+    first_event = True
+    if not background:
+        INFLIGHT_REQUESTS.inc()
+        persist(store.track_query, query)
+
+    def track(source: str, task: asyncio.Task) -> asyncio.Task:
+        """Keep per-source in-flight counts, error counts and total times up to date."""
+        INFLIGHT_SOURCES.labels(source).inc()
+        def done(t: asyncio.Task) -> None:
+            INFLIGHT_SOURCES.labels(source).dec()
+            if t.cancelled():
+                return
+            error = t.exception()
+            if isinstance(error, StopAsyncIteration) or (error is None and source not in generators):
+                # the source is done: its task returned, or its generator is exhausted
+                PHASE_SECONDS.labels(source, "total").observe(time.perf_counter() - start)
+            elif error is not None:
+                SOURCE_ERRORS.labels(source).inc()
+        task.add_done_callback(done)
+        return task
+
+    # set when the search ends: cancelling the tasks does not stop the threads they started,
+    # the blocking fan-outs drop their queued work once it is set (see `cancel.py`)
+    stop = threading.Event()
+
+    # sources streaming several events are async generators, one task per event
+    generators = {"arxiv": stream_arxiv(query, 5)}
+    if fast:
+        generators["reddit"] = stream_unverified(
+            "reddit", lambda: reddit_search(query, 2, 2, verify=False, stop=stop),
+            lambda urls: reddit_check_urls(urls, max_workers=30, stop=stop), describe=False, stop=stop)
+        generators["hn"] = stream_unverified(
+            "hn", lambda: hn_search(query, hits=30, top_k=10, verify=False, stop=stop),
+            lambda urls: hn_check_urls(urls, max_workers=30, stop=stop), describe=True, stop=stop)
+
+    starts: Dict[str, Callable[[], Coroutine[Any, Any, Any]]] = {
+        # locally known, recently verified matches make the first event instant
+        "local": lambda: search_store(query),
+        "wiki": lambda: wikipedia_search(query),
+        "reddit": lambda: asyncio.to_thread(reddit_search, query, 2, 2, stop=stop),
+        "hn": lambda: asyncio.to_thread(hn_search, query, hits=30, top_k=10, include_meta=True, stop=stop),
+    }
+    starts.update({name: gen.__anext__ for name, gen in generators.items()})
+
+    # sources failing right now are not waited for
+    degraded = [name for name in starts if name != "local" and breakers.get(name).is_open()]
     tasks = {
-        "wiki": wiki_task,
-        "reddit": reddit_task,
-        "hn": hn_task,
-        "arxiv": arxiv_task
+        name: track(name, asyncio.create_task(start()))
+        for name, start in starts.items() if name not in degraded
     }
+    sources = {t: name for name, t in tasks.items()}
 
     pending = set(tasks.values())
-    while pending:
-        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
-        for d in done:
-
-            if d == tasks["wiki"]:
-                wiki = d.result()
-                yield ("WikiMedia", [f"{wiki.title}\n  {wiki.url}\n (No description)"])
-            elif d == tasks["hn"]:
-                hn_resources = d.result()
-                lines = [
-                    f"{r.title}\n  {r.url}\n  {r.description or '(No description)'}" for r in hn_resources
-                ]
-                yield ("HackerNews", lines)
-
-            elif d == tasks["reddit"]:
-                reddit_links = d.result()
-                yield ("Reddit", [f"(No title)\n {link}\n (No description)" for link in reddit_links])
-
-            elif d == tasks["arxiv"]:
+    try:
+        for name in degraded:
+            yield {"type": "degraded", "source": LABELS[name]}
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for d in done:
+                source = sources[d]
                 try:
-                    r = d.result()
-                    yield ("arXiv", [f"{r.title}\n  {r.url}\n  {r.description}"])
-                    # schedule next arxiv result
-                    tasks["arxiv"] = asyncio.create_task(arxiv_gen.__anext__())
-                    pending.add(tasks["arxiv"])
+                    result = d.result()
                 except StopAsyncIteration:
-                    # no more arxiv results
-                    pass
+                    # no more results from this generator
+                    continue
+                except CircuitOpen:
+                    yield {"type": "degraded", "source": LABELS[source]}
+                    continue
+                except Exception as e:
+                    print(f"Source {source} failed: {e!r}")
+                    continue
+
+                if source in generators:
+                    # schedule the next event of this source
+                    tasks[source] = track(source, asyncio.create_task(generators[source].__anext__()))
+                    sources[tasks[source]] = source
+                    pending.add(tasks[source])
+
+                if isinstance(result, Verification):
+                    persist(store.record, query, result.live)
+                    yield {"type": "update", "source": LABELS[source], "updates": as_updates(result)}
+                    continue
+
+                resources = as_list(result)
+                if source == "local":
+                    record_cache("store", hit=bool(resources))
+                else:
+                    # unverified resources are skipped by the store
+                    persist(store.record, query, resources)
+
+                if resources:
+                    if first_event and not background:
+                        FIRST_EVENT_SECONDS.observe(time.perf_counter() - start)
+                        first_event = False
+                    yield {"type": "results", "source": LABELS[source], "resources": resources}
+    finally:
+        # the client went away (or a source raised): stop the remaining work
+        stop.set()
+        for t in pending:
+            t.cancel()
+        if not background:
+            INFLIGHT_REQUESTS.dec()
+            REQUEST_SECONDS.observe(time.perf_counter() - start)
+
+
+def make_prefetcher(budget: PrefetchBudget) -> Prefetcher:
+    return Prefetcher(store, search_stream, budget)
 
 
 async def main():
     """Only for CLI usage"""
+    parser = argparse.ArgumentParser(description="Search resources, or keep popular topics warm.")
+    parser.add_argument("--prefetch", action="store_true", help="run the background prefetcher")
+    parser.add_argument("--once", action="store_true", help="with --prefetch: a single pass, then exit")
+    args = parser.parse_args()
+
+    if args.prefetch:
+        prefetcher = make_prefetcher(PrefetchBudget.from_env())
+        if args.once:
+            print(f"Prefetched {await prefetcher.run_once()} popular queries")
+        else:
+            await prefetcher.run_forever()
+        return
+
     q = input("What would you like to learn?\n")
-    async for src, lines in search_stream(q):
-        print(f"{src}: {lines}")
+    async for event in search_stream(q):
+        print(event)
 
 
 if __name__ == "__main__":
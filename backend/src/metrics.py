@@ -0,0 +1,66 @@
+"""
+Prometheus metrics shared by the search pipeline and every source.
+
+Sources are labelled with the short keys used in `search_stream` ("wiki", "reddit",
+"hn", "arxiv"); phases are "upstream" (API call), "liveness", "meta", "embedding"
+and "total" (from request start until the source is done, once per source and request).
+All metrics are process-local and cheap enough to stay always on.
+"""
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+from .tracing import traced
+
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+PHASE_SECONDS = Histogram(
+    "properly_phase_seconds", "Time spent per source and phase",
+    ["source", "phase"], buckets=LATENCY_BUCKETS,
+)
+FIRST_EVENT_SECONDS = Histogram(
+    "properly_time_to_first_event_seconds", "Time from request start to the first streamed event",
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "properly_request_seconds", "Time from request start to the end of the stream",
+    buckets=LATENCY_BUCKETS,
+)
+INFLIGHT_REQUESTS = Gauge("properly_inflight_requests", "Searches currently streaming")
+INFLIGHT_SOURCES = Gauge("properly_inflight_sources", "Source lookups currently running", ["source"])
+SOURCE_ERRORS = Counter("properly_source_errors_total", "Failed upstream calls or source lookups", ["source"])
+LIVENESS_CHECKS = Counter("properly_liveness_checks_total", "Liveness checks by outcome", ["source", "result"])
+CACHE_LOOKUPS = Counter("properly_cache_lookups_total", "Cache lookups by outcome", ["cache", "result"])
+
+
+@contextmanager
+def span(source: str, phase: str) -> Iterator[None]:
+    """
+    Time the enclosed block into `properly_phase_seconds{source, phase}`,
+    and into the request trace when one is active.
+    """
+    start = time.perf_counter()
+    try:
+        with traced(f"{source} {phase}", "phase"):
+            yield
+    finally:
+        PHASE_SECONDS.labels(source, phase).observe(time.perf_counter() - start)
+
+
+def record_liveness(source: str, results: Iterable[Optional[bool]]) -> None:
+    """Count liveness checks: live, dead, or unknown (None, the host was not contacted)."""
+    results = list(results)
+    for result, value in (("live", True), ("dead", False), ("unknown", None)):
+        LIVENESS_CHECKS.labels(source, result).inc(sum(1 for r in results if r is value))
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def render() -> Tuple[bytes, str]:
+    """Current metrics in the Prometheus text format, with its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,316 @@
+"""
+Request policies for upstream search APIs (Algolia, Wikipedia, Reddit search).
+
+A policy bounds a call with a deadline, retries transient errors with jittered
+exponential backoff and, optionally, hedges: when an attempt is slower than a
+percentile of the upstream's recent latencies, a duplicate is fired and the
+first answer wins. Hedges are paid from one process-wide budget that only
+grows with primary requests, so hedging cannot amplify load beyond `ratio`.
+
+`call` runs blocking calls (requests, PRAW), `acall` coroutines (aiohttp); both
+take a function of the per-attempt timeout, in seconds. A blocking attempt runs on
+the calling thread, so it never waits for a pool; only its hedge does, and the
+hedge answers when the attempt itself fails or times out. Both go through the
+upstream's circuit breaker (see `breaker.py`): while it is open they raise
+`CircuitOpen` right away. Only timeouts and transient errors count against it.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Generic, List, Optional, Tuple, TypeVar
+
+from prometheus_client import Counter
+
+from .tracing import traced, propagate
+from .breaker import guard, sources
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+MIN_SAMPLES = 20   # recent latencies needed before hedging kicks in
+
+UPSTREAM_EXTRA = Counter(
+    "properly_upstream_extra_requests_total", "Retries and hedges sent to upstream APIs",
+    ["upstream", "kind"],
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+@dataclass(frozen=True)
+class RequestPolicy:
+    """
+    - deadline: seconds for the whole call, retries and hedges included
+    - attempt_timeout: seconds for a single attempt
+    - retries: attempts after the first one, transient errors only
+    - backoff: base of the exponential backoff; the sleep is uniform in [0, backoff * 2**retry]
+    - hedge_percentile: hedge attempts slower than this percentile of recent latencies (None: never)
+    - min_hedge_delay: never hedge before this many seconds
+    """
+    deadline: float
+    attempt_timeout: float
+    retries: int = 2
+    backoff: float = 0.1
+    hedge_percentile: Optional[float] = None
+    min_hedge_delay: float = 0.05
+
+
+POLICIES: Dict[str, RequestPolicy] = {
+    "hn": RequestPolicy(deadline=6.0, attempt_timeout=3.0, hedge_percentile=95),
+    "wiki": RequestPolicy(deadline=5.0, attempt_timeout=2.5, hedge_percentile=95),
+    "reddit": RequestPolicy(deadline=10.0, attempt_timeout=5.0, retries=1),
+}
+
+
+class LatencyWindow:
+    """Latencies of the last `size` successful attempts of one upstream."""
+
+    def __init__(self, size: int = 200) -> None:
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+class HedgeBudget:
+    """Token bucket: every primary request earns `ratio` of a hedge, at most `burst` are saved."""
+
+    def __init__(self, ratio: float, burst: float) -> None:
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def earn(self) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+hedges = HedgeBudget(
+    ratio=float(os.getenv("PROPERLY_HEDGE_RATIO", 0.05)),
+    burst=float(os.getenv("PROPERLY_HEDGE_BURST", 5)),
+)
+_latencies: Dict[str, LatencyWindow] = {}
+_latencies_lock = threading.Lock()
+_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="upstream")
+
+
+def latencies(upstream: str) -> LatencyWindow:
+    with _latencies_lock:
+        return _latencies.setdefault(upstream, LatencyWindow())
+
+
+def hedge_delay(upstream: str, policy: RequestPolicy) -> Optional[float]:
+    if policy.hedge_percentile is None:
+        return None
+    p = latencies(upstream).percentile(policy.hedge_percentile)
+    return None if p is None else max(policy.min_hedge_delay, p)
+
+
+def unavailable(e: BaseException, transient: Callable[[BaseException], bool]) -> bool:
+    """Attempt timeouts and deadlines are always about availability, other errors as the caller says."""
+    return isinstance(e, TimeoutError) or transient(e)
+
+
+def retryable(e: BaseException, retry: int, policy: RequestPolicy, transient: Callable[[BaseException], bool]) -> bool:
+    return retry < policy.retries and unavailable(e, transient)
+
+
+def backoff(policy: RequestPolicy, retry: int, deadline: float) -> Optional[float]:
+    """Jittered sleep before `retry`, None if it would not leave time for another attempt."""
+    delay = random.uniform(0, policy.backoff * 2 ** retry)
+    return delay if time.monotonic() + delay < deadline else None
+
+
+# --- blocking calls ---
+
+def call(upstream: str, fn: Callable[[float], T], transient: Callable[[BaseException], bool], policy: Optional[RequestPolicy] = None) -> T:
+    """Run `fn(attempt_timeout)` under the policy and the circuit breaker of `upstream`."""
+    with guard(sources.get(upstream), upstream, lambda e: unavailable(e, transient)):
+        return _call(upstream, fn, transient, policy or POLICIES[upstream])
+
+
+def _call(upstream: str, fn: Callable[[float], T], transient: Callable[[BaseException], bool], policy: RequestPolicy) -> T:
+    deadline = time.monotonic() + policy.deadline
+    hedges.earn()
+    retry = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{upstream}: deadline of {policy.deadline}s exceeded")
+        try:
+            with traced("attempt", "policy", upstream=upstream, retry=retry):
+                return _attempt(upstream, fn, min(policy.attempt_timeout, remaining), policy)
+        except Exception as e:
+            if not retryable(e, retry, policy, transient) or (delay := backoff(policy, retry, deadline)) is None:
+                raise
+        retry += 1
+        UPSTREAM_EXTRA.labels(upstream, "retry").inc()
+        time.sleep(delay)
+
+
+def _attempt(upstream: str, fn: Callable[[float], T], timeout: float, policy: RequestPolicy) -> T:
+    start = time.monotonic()
+    delay = hedge_delay(upstream, policy)
+    if delay is None or delay >= timeout:
+        result = fn(timeout)
+    else:
+        hedge = Hedge(upstream, fn, start + timeout)
+        _timer.schedule(delay, hedge.fire)
+        try:
+            result = fn(timeout)
+        except Exception as e:
+            result = hedge.rescue(e)
+        finally:
+            hedge.stop()
+    latencies(upstream).observe(time.monotonic() - start)
+    return result
+
+
+class Hedge(Generic[T]):
+    """The duplicate of one blocking attempt, fired on the pool once the attempt is slow."""
+
+    def __init__(self, upstream: str, fn: Callable[[float], T], end: float) -> None:
+        self.upstream = upstream
+        self.fn = fn
+        self.end = end
+        self.future: "Optional[Future[T]]" = None
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    def fire(self) -> None:
+        """Called by the timer: submit the hedge, unless the attempt is over or the budget is spent."""
+        with self._lock:
+            remaining = self.end - time.monotonic()
+            if self._stopped or remaining <= 0 or not hedges.spend():
+                return
+            UPSTREAM_EXTRA.labels(self.upstream, "hedge").inc()
+            self.future = _pool.submit(propagate(lambda: self.fn(remaining)))
+
+    def rescue(self, error: Exception) -> T:
+        """The hedge's answer once the attempt failed with `error`, which is raised if there is none."""
+        with self._lock:
+            self._stopped = True
+            future = self.future
+        if future is None or future.cancel():
+            raise error  # not fired, or still queued: not worth waiting for
+        try:
+            return future.result(timeout=max(0.0, self.end - time.monotonic()))
+        except Exception:
+            raise error
+
+    def stop(self) -> None:
+        """The attempt is over: drop the hedge if it has not started (a running one is abandoned)."""
+        with self._lock:
+            self._stopped = True
+            if self.future is not None:
+                self.future.cancel()
+
+
+class HedgeTimer:
+    """One thread firing the hedges that are due, so that waiting to hedge holds no thread."""
+
+    def __init__(self) -> None:
+        self._due: List[Tuple[float, int, Callable[[], None]]] = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, delay: float, fire: Callable[[], None]) -> None:
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="hedge-timer", daemon=True)
+                self._thread.start()
+            heapq.heappush(self._due, (time.monotonic() + delay, next(self._order), fire))
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._due or self._due[0][0] > time.monotonic():
+                    self._cond.wait(self._due[0][0] - time.monotonic() if self._due else None)
+                _, _, fire = heapq.heappop(self._due)
+            fire()
+
+
+_timer = HedgeTimer()
+
+
+# --- coroutines ---
+
+async def acall(upstream: str, fn: Callable[[float], Awaitable[T]], transient: Callable[[BaseException], bool], policy: Optional[RequestPolicy] = None) -> T:
+    """Await `fn(attempt_timeout)` under the policy and the circuit breaker of `upstream`."""
+    with guard(sources.get(upstream), upstream, lambda e: unavailable(e, transient)):
+        return await _acall(upstream, fn, transient, policy or POLICIES[upstream])
+
+
+async def _acall(upstream: str, fn: Callable[[float], Awaitable[T]], transient: Callable[[BaseException], bool], policy: RequestPolicy) -> T:
+    deadline = time.monotonic() + policy.deadline
+    hedges.earn()
+    retry = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{upstream}: deadline of {policy.deadline}s exceeded")
+        try:
+            with traced("attempt", "policy", upstream=upstream, retry=retry):
+                return await _aattempt(upstream, fn, min(policy.attempt_timeout, remaining), policy)
+        except Exception as e:
+            if not retryable(e, retry, policy, transient) or (delay := backoff(policy, retry, deadline)) is None:
+                raise
+        retry += 1
+        UPSTREAM_EXTRA.labels(upstream, "retry").inc()
+        await asyncio.sleep(delay)
+
+
+async def _aattempt(upstream: str, fn: Callable[[float], Awaitable[T]], timeout: float, policy: RequestPolicy) -> T:
+    start = time.monotonic()
+    delay = hedge_delay(upstream, policy)
+    tasks = [asyncio.ensure_future(asyncio.wait_for(fn(timeout), timeout))]
+    try:
+        if delay is not None and delay < timeout:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and hedges.spend():
+                UPSTREAM_EXTRA.labels(upstream, "hedge").inc()
+                tasks.append(asyncio.ensure_future(asyncio.wait_for(fn(timeout), timeout)))
+
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    latencies(upstream).observe(time.monotonic() - start)
+                    return t.result()
+                error = t.exception()
+        assert error is not None
+        raise error
+    finally:
+        # the losing hedge (or everything, when cancelled) is not needed anymore
+        for t in tasks:
+            t.cancel()
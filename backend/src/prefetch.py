@@ -0,0 +1,126 @@
+"""
+Background prefetch of popular topics, so that their first hit is served warm.
+
+Periodically the most searched queries whose results are about to stop being
+"recently verified" are searched again in the background, and the stored urls
+that search did not revisit get their liveness and description re-checked.
+Prefetching only runs while user traffic is low and within a fixed budget.
+
+Both signals live in the store, so they hold across processes (API workers, the
+standalone `--prefetch`): traffic is low when no user search started anywhere for
+`quiet_for` seconds, and a lease lets a single process prefetch at a time.
+"""
+import asyncio
+import os
+import socket
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from .hackerNews.lib import check_live_urls, get_meta_bulk
+from .store import ResourceStore, FRESH_FOR
+
+
+@dataclass(frozen=True)
+class PrefetchBudget:
+    """
+    - top_n: queries refreshed per pass at most
+    - concurrency: background searches running at the same time
+    - interval: seconds between passes
+    - refresh_margin: refresh this many seconds before results stop being fresh
+    - quiet_for: only prefetch when no user search started in the last `quiet_for` seconds
+    - max_workers: threads for re-checking liveness and meta of stored urls
+    """
+    top_n: int = 20
+    concurrency: int = 2
+    interval: float = 300.0
+    refresh_margin: float = 2 * 3600.0
+    quiet_for: float = 60.0
+    max_workers: int = 5
+
+    @classmethod
+    def from_env(cls) -> "PrefetchBudget":
+        """Override any field with `PROPERLY_PREFETCH_<FIELD>`, e.g. `PROPERLY_PREFETCH_TOP_N=50`."""
+        def env(name: str, default: float) -> str:
+            return os.getenv(f"PROPERLY_PREFETCH_{name.upper()}", str(default))
+
+        return cls(
+            top_n=int(env("top_n", cls.top_n)),
+            concurrency=int(env("concurrency", cls.concurrency)),
+            interval=float(env("interval", cls.interval)),
+            refresh_margin=float(env("refresh_margin", cls.refresh_margin)),
+            quiet_for=float(env("quiet_for", cls.quiet_for)),
+            max_workers=int(env("max_workers", cls.max_workers)),
+        )
+
+
+class Prefetcher:
+
+    def __init__(
+        self,
+        store: ResourceStore,
+        search: Callable,
+        budget: PrefetchBudget = PrefetchBudget()) -> None:
+        """`search` is `search_stream`."""
+        self.store = store
+        self.search = search
+        self.budget = budget
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+
+
+    def off_peak(self) -> bool:
+        return time.time() - self.store.last_search() >= self.budget.quiet_for
+
+
+    async def refresh(self, query: str) -> None:
+        """Re-run the search in the background and re-verify what it didn't revisit."""
+        async for _ in self.search(query, background=True):
+            pass
+
+        # urls the fresh search recorded were verified just now, leftovers are re-checked;
+        # those of unknown liveness (host circuit breaker open) are left for the next pass
+        stale = await asyncio.to_thread(self.store.stale_urls, query, FRESH_FOR - self.budget.refresh_margin)
+        if stale:
+            checked = await asyncio.to_thread(check_live_urls, stale, max_workers=self.budget.max_workers)
+            known = [url for url, live in checked.items() if live is not None]
+            live = [url for url in known if checked[url]]
+            meta = await asyncio.to_thread(get_meta_bulk, live, max_workers=self.budget.max_workers)
+            await asyncio.to_thread(self.store.reverify, known, live, meta)
+
+        await asyncio.to_thread(self.store.mark_refreshed, query)
+
+
+    async def run_once(self) -> int:
+        """One scheduling pass, returns the number of refreshed queries."""
+        # held across passes, the other processes take over if this one stops renewing it
+        leased = await asyncio.to_thread(self.store.acquire_lease, "prefetch", self.holder, 2 * self.budget.interval)
+        if not leased or not await asyncio.to_thread(self.off_peak):
+            return 0
+        due = await asyncio.to_thread(
+            self.store.due_queries, self.budget.top_n, FRESH_FOR - self.budget.refresh_margin
+        )
+        slots = asyncio.Semaphore(self.budget.concurrency)
+        refreshed = 0
+
+        async def one(query: str) -> None:
+            nonlocal refreshed
+            async with slots:
+                # traffic may have picked up while waiting for a slot
+                if not await asyncio.to_thread(self.off_peak):
+                    return
+                try:
+                    await self.refresh(query)
+                    refreshed += 1
+                except Exception as e:
+                    print(f"Prefetch of {query!r} failed: {e!r}")
+
+        await asyncio.gather(*(one(q) for q in due))
+        return refreshed
+
+
+    async def run_forever(self) -> None:
+        while True:
+            refreshed = await self.run_once()
+            if refreshed:
+                print(f"Prefetched {refreshed} popular queries")
+            await asyncio.sleep(self.budget.interval)
@@ -0,0 +1,60 @@
+"""
+Per-submission cache of the links extracted from a Reddit thread.
+
+Popular threads (e.g. resource megathreads) come up for many related queries.
+Their ranked, verified links are cached by submission id together with the
+comment count they were extracted at: a thread is re-crawled only when its
+comment count (known from the search listing, for free) has changed or its
+entry is older than `ttl` seconds (`PROPERLY_REDDIT_THREAD_TTL`).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from ..metrics import record_cache
+
+TTL = float(os.getenv("PROPERLY_REDDIT_THREAD_TTL", 3600))
+MAX_THREADS = 2048
+
+
+@dataclass(frozen=True)
+class CachedThread:
+    links: Tuple[str, ...]
+    num_comments: int
+    fetched_at: float
+
+
+class ThreadCache:
+    """Thread-safe, bounded (least recently used first out)."""
+
+    def __init__(self, ttl: float = TTL, max_threads: int = MAX_THREADS) -> None:
+        self.ttl = ttl
+        self.max_threads = max_threads
+        self._lock = threading.Lock()
+        self._threads: "OrderedDict[str, CachedThread]" = OrderedDict()
+
+
+    def get(self, submission_id: str, num_comments: int) -> Optional[CachedThread]:
+        """The cached entry, unless the thread has new comments or the entry expired."""
+        with self._lock:
+            entry = self._threads.get(submission_id)
+            fresh = (
+                entry is not None
+                and entry.num_comments == num_comments
+                and time.time() - entry.fetched_at < self.ttl
+            )
+            if fresh:
+                self._threads.move_to_end(submission_id)
+        record_cache("reddit_thread", hit=fresh)
+        return entry if fresh else None
+
+
+    def put(self, submission_id: str, num_comments: int, links: Tuple[str, ...]) -> None:
+        with self._lock:
+            self._threads[submission_id] = CachedThread(links, num_comments, time.time())
+            self._threads.move_to_end(submission_id)
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
@@ -1,3 +1,5 @@
+import re
+
 EDU_SUBREDDITS = [
     # Science (natural / physical / life)
     "askscience", "biology", "chemistry", "physics", "geology", "astronomy",
@@ -17,3 +19,5 @@ EDU_SUBREDDITS = [
     "MachineLearningTheory", "NeuralNetworks", "DeepLearning", "ReinforcementLearning",
     "QuantumComputing", "QuantumMechanics", "PhilosophicalQuestions"
 ]
+
+URL_RE = re.compile(r'(https?://\S+)')
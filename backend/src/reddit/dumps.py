@@ -0,0 +1,305 @@
+"""
+Offline Reddit: build a local link index from Reddit dumps, so that the Reddit
+source can answer without calling the Reddit API.
+
+Input are the monthly submission (`RS_*.zst`) and comment (`RC_*.zst`) dumps:
+zstd-compressed NDJSON, one object per line. They are streamed in constant
+memory, and only posts of educational subreddits are kept (`EDU_SUBREDDITS`
+and the subreddits of the semantic index).
+
+  1. submissions: keep posts, their own external link counts as one of their links
+  2. comments: extract links from comments of kept posts, each ranked by the best
+     score of a comment mentioning it (as `extract_links` ranks them live)
+  3. embed the titles of posts with at least one link into a FAISS index
+
+Ingesting is idempotent: every mention of a link is recorded once, by the id of the
+post or comment it comes from, so a dump ingested twice (or overlapping dumps) does
+not count its links twice.
+
+Everything lives in one directory: `posts.db` (SQLite) and `titles.index`.
+With `PROPERLY_REDDIT_INDEX=<dir>` the Reddit source answers from it.
+
+Usage (from root folder):
+    python -m backend.src.reddit.dumps --submissions RS_2024-01.zst --comments RC_2024-01.zst --index reddit-index
+"""
+from __future__ import annotations
+import argparse
+import io
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterable, Iterator, List, Optional, Set, TYPE_CHECKING, cast
+
+import numpy as np
+import orjson
+import zstandard
+
+from .const import EDU_SUBREDDITS
+from .embeddings import shared_index
+from .lib import find_urls
+from ..resource import Resource
+
+if TYPE_CHECKING:
+    import faiss  # type: ignore
+
+INDEX_DIR: Optional[str] = os.getenv("PROPERLY_REDDIT_INDEX")
+BATCH = 10_000        # rows per SQLite transaction
+EMBED_BATCH = 256     # titles per encode call
+MAX_WINDOW = 2 ** 31  # the dumps are compressed with a long window
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id           INTEGER PRIMARY KEY,
+    reddit_id    TEXT NOT NULL UNIQUE,
+    subreddit    TEXT NOT NULL,
+    title        TEXT NOT NULL,
+    score        INTEGER NOT NULL,
+    num_comments INTEGER NOT NULL,
+    created_utc  REAL NOT NULL,
+    url          TEXT  -- the post's own external link, if any
+);
+CREATE TABLE IF NOT EXISTS links (
+    post_id  INTEGER NOT NULL REFERENCES posts(id),
+    url      TEXT NOT NULL,
+    score    INTEGER NOT NULL,
+    mentions INTEGER NOT NULL,
+    PRIMARY KEY (post_id, url)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS mentions (
+    post_id   INTEGER NOT NULL REFERENCES posts(id),
+    url       TEXT NOT NULL,
+    source_id TEXT NOT NULL,  -- fullname of the mentioning post (t3_) or comment (t1_)
+    score     INTEGER NOT NULL,
+    PRIMARY KEY (post_id, url, source_id)
+) WITHOUT ROWID;
+
+-- a link keeps its best mention score and counts its mentions; mentions already
+-- recorded are ignored on insert, so they don't reach this trigger
+CREATE TRIGGER IF NOT EXISTS mentions_ai AFTER INSERT ON mentions BEGIN
+    INSERT INTO links (post_id, url, score, mentions) VALUES (new.post_id, new.url, new.score, 1)
+    ON CONFLICT(post_id, url) DO UPDATE SET
+        score = max(score, excluded.score), mentions = mentions + 1;
+END;
+"""
+
+
+def read_ndjson(path: str) -> Iterator[dict]:
+    """Objects of a zstd-compressed (or plain) NDJSON file, one at a time."""
+    with open(path, "rb") as fh:
+        raw: IO[bytes] = fh
+        if path.endswith(".zst"):
+            raw = zstandard.ZstdDecompressor(max_window_size=MAX_WINDOW).stream_reader(fh)
+        for line in io.BufferedReader(cast(io.RawIOBase, raw)):
+            try:
+                yield orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue  # truncated or corrupt line
+
+
+def allowed_subreddits() -> Set[str]:
+    """EDU_SUBREDDITS and the subreddits of the semantic index, lowercase."""
+    names = set(EDU_SUBREDDITS)
+    index_names = Path(__file__).parent / "subredditsNames.npy"
+    if index_names.exists():
+        names.update(str(n) for n in np.load(index_names, allow_pickle=True))
+    return {n.lower() for n in names}
+
+
+def is_external(url: str) -> bool:
+    return url.startswith("http") and "reddit.com" not in url and "redd.it" not in url
+
+
+class DumpIndex:
+    """The SQLite side of the offline index, written by `ingest_*` and read by `OfflineIndex`."""
+
+    def __init__(self, directory: str) -> None:
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.directory = directory
+        self.conn = sqlite3.connect(str(Path(directory) / "posts.db"), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=OFF")  # rebuilt from the dumps if lost
+        self.conn.executescript(SCHEMA)
+        if "url" not in {column for _, column, *_ in self.conn.execute("PRAGMA table_info(posts)")}:
+            self.conn.execute("ALTER TABLE posts ADD COLUMN url TEXT")  # index built before the column
+
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Explicit transaction (the connection is in autocommit mode), rolled back on error."""
+        self.conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+
+    def write(self, sql: str, rows: Iterable[tuple]) -> int:
+        """Run `sql` over `rows` in transactions of BATCH rows, returns the number of rows changed."""
+        n = 0
+        batch: List[tuple] = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == BATCH:
+                n += self._commit(sql, batch)
+                batch = []
+        return n + self._commit(sql, batch)
+
+
+    def _commit(self, sql: str, batch: List[tuple]) -> int:
+        with self._transaction():
+            return self.conn.executemany(sql, batch).rowcount
+
+
+    def ingest_submissions(self, path: str, subreddits: Set[str]) -> int:
+        def rows() -> Iterator[tuple]:
+            for post in read_ndjson(path):
+                if (post.get("subreddit") or "").lower() in subreddits and post.get("title"):
+                    url = post.get("url") or ""
+                    yield (post["id"], post["subreddit"], post["title"], post.get("score") or 0,
+                           post.get("num_comments") or 0, float(post.get("created_utc") or 0),
+                           url if is_external(url) else None)
+
+        n = self.write(
+            """
+            INSERT INTO posts (reddit_id, subreddit, title, score, num_comments, created_utc, url)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(reddit_id) DO UPDATE SET
+                score = excluded.score, num_comments = excluded.num_comments, url = excluded.url
+            """,
+            rows(),
+        )
+        # link posts: their own url is one of their links, mentioned by the post itself
+        with self._transaction():
+            self.conn.execute(
+                """
+                INSERT OR IGNORE INTO mentions (post_id, url, source_id, score)
+                SELECT id, url, 't3_' || reddit_id, score FROM posts WHERE url IS NOT NULL
+                """
+            )
+        return n
+
+
+    def ingest_comments(self, path: str, subreddits: Set[str]) -> int:
+        def rows() -> Iterator[tuple]:
+            for comment in read_ndjson(path):
+                body = comment.get("body") or ""
+                if "http" not in body or (comment.get("subreddit") or "").lower() not in subreddits:
+                    continue
+                post_id = (comment.get("link_id") or "").removeprefix("t3_")
+                for url in dict.fromkeys(find_urls(body)):
+                    yield (url, f"t1_{comment.get('id')}", comment.get("score") or 0, post_id)
+
+        # counts new mentions only: those already recorded, or of posts not kept, change nothing
+        return self.write(MENTION_INSERT, rows())
+
+
+    def embed_titles(self, index_file: str) -> int:
+        """Embed the titles of posts with links, in batches, into a FAISS inner-product index."""
+        import faiss  # type: ignore
+
+        semantic = shared_index()
+        index: Optional[faiss.Index] = None
+        cursor = self.conn.execute(
+            "SELECT id, title FROM posts WHERE EXISTS (SELECT 1 FROM links WHERE post_id = posts.id) ORDER BY id"
+        )
+        n = 0
+        while batch := cursor.fetchmany(EMBED_BATCH):
+            ids = np.array([i for i, _ in batch], dtype=np.int64)
+            embeddings = semantic.encode([t for _, t in batch])
+            if index is None:
+                index = faiss.IndexIDMap(faiss.IndexFlatIP(embeddings.shape[1]))
+            index.add_with_ids(embeddings, ids)  # type: ignore
+            n += len(batch)
+        if index is not None:
+            faiss.write_index(index, index_file)
+        return n
+
+
+# Comments of posts that were not kept match no post and are dropped by the SELECT;
+# `links` is kept up to date by the `mentions_ai` trigger.
+MENTION_INSERT = """
+INSERT OR IGNORE INTO mentions (post_id, url, source_id, score)
+SELECT id, ?, ?, ? FROM posts WHERE reddit_id = ?
+"""
+
+
+class OfflineIndex:
+    """Read side: the posts most similar to a query, and their ranked links."""
+
+    def __init__(self, directory: str) -> None:
+        self.db = DumpIndex(directory)
+        self.index_file = str(Path(directory) / "titles.index")
+        self._index: Optional[faiss.Index] = None
+        self._lock = threading.Lock()
+
+
+    def load(self) -> faiss.Index:
+        import faiss  # type: ignore
+
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.read_index(self.index_file)
+            return self._index
+
+
+    def search(self, query: str, n_posts: int, links_per_post: int = 20) -> List[Resource]:
+        """Links of the `n_posts` posts whose title is closest to the query, best posts and links first."""
+        _, I = self.load().search(shared_index().encode([query]), n_posts)  # type: ignore
+        resources: List[Resource] = []
+        for post_id in I[0]:
+            if post_id < 0:
+                continue
+            subreddit, title = self.db.conn.execute(
+                "SELECT subreddit, title FROM posts WHERE id = ?", (int(post_id),)
+            ).fetchone()
+            rows = self.db.conn.execute(
+                "SELECT url FROM links WHERE post_id = ? ORDER BY score DESC, mentions DESC LIMIT ?",
+                (int(post_id), links_per_post),
+            ).fetchall()
+            resources.extend(
+                Resource("reddit", None, url, description=f"From r/{subreddit}: {title}", verified=False)
+                for (url,) in rows
+            )
+        return resources
+
+
+_offline: Optional[OfflineIndex] = None
+_offline_lock = threading.Lock()
+
+def offline_index() -> Optional[OfflineIndex]:
+    """The index at `PROPERLY_REDDIT_INDEX`, None when offline Reddit is not configured."""
+    global _offline
+    if INDEX_DIR is None:
+        return None
+    with _offline_lock:
+        if _offline is None:
+            _offline = OfflineIndex(INDEX_DIR)
+        return _offline
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the offline Reddit link index from dumps.")
+    parser.add_argument("--submissions", nargs="*", default=[], help="RS_*.zst files")
+    parser.add_argument("--comments", nargs="*", default=[], help="RC_*.zst files")
+    parser.add_argument("--index", default=INDEX_DIR or "reddit-index", help="output directory")
+    parser.add_argument("--skip-embedding", action="store_true", help="only ingest, embed later")
+    args = parser.parse_args()
+
+    subreddits = allowed_subreddits()
+    db = DumpIndex(args.index)
+    # all submissions first: comments are matched to the posts already ingested
+    for path in args.submissions:
+        print(f"{path}: kept {db.ingest_submissions(path, subreddits)} posts")
+    for path in args.comments:
+        print(f"{path}: {db.ingest_comments(path, subreddits)} new link mentions in comments")
+    if not args.skip_embedding:
+        n = db.embed_titles(str(Path(args.index) / "titles.index"))
+        print(f"Embedded {n} post titles")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Embedding sidecar: one process owns the SentenceTransformer model and the FAISS index,
+API workers talk to it over a Unix socket instead of each loading their own copy.
+
+Encode requests from all workers are micro-batched: the first request opens a batch,
+which is run through the model once it holds `max_batch` texts or `max_wait` seconds
+have passed, whichever comes first.
+
+Wire format, both directions: `!II` (header length, payload length), a JSON header,
+then a binary payload (float32 embeddings in responses, empty otherwise).
+
+Usage (from root folder):
+    python -m backend.src.reddit.embed_service --socket /tmp/properly-embed.sock
+    PROPERLY_EMBED_SOCKET=/tmp/properly-embed.sock fastapi run backend/api.py --workers 4
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+from typing import Any, Dict, List, Sequence, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .embeddings import SemanticIndex, SearchResult
+
+FRAME = struct.Struct("!II")
+MAX_BATCH = 64       # texts per model call
+MAX_WAIT = 0.005     # seconds a request may wait for others to join its batch
+
+
+def pack(header: Dict[str, Any], payload: bytes = b"") -> bytes:
+    head = json.dumps(header).encode()
+    return FRAME.pack(len(head), len(payload)) + head + payload
+
+
+def recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("embedding sidecar closed the connection")
+        buf += chunk
+    return bytes(buf)
+
+
+class EmbeddingClient:
+    """
+    Blocking client, safe to share between threads: each thread keeps its own
+    connection to the sidecar and reconnects once if it was dropped.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 10.0) -> None:
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self._local.sock = sock
+        return sock
+
+
+    def _call(self, header: Dict[str, Any]) -> Tuple[Dict[str, Any], bytes]:
+        for attempt in (1, 2):
+            sock = getattr(self._local, "sock", None) or self._connect()
+            try:
+                sock.sendall(pack(header))
+                head_len, payload_len = FRAME.unpack(recv_exact(sock, FRAME.size))
+                response = json.loads(recv_exact(sock, head_len))
+                payload = recv_exact(sock, payload_len)
+                break
+            except (ConnectionError, BrokenPipeError, socket.timeout):
+                sock.close()
+                self._local.sock = None
+                if attempt == 2:
+                    raise
+        if not response.get("ok"):
+            raise RuntimeError(f"embedding sidecar error: {response.get('error')}")
+        return response, payload
+
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        response, payload = self._call({"op": "encode", "texts": list(texts)})
+        return np.frombuffer(payload, dtype=np.float32).reshape(response["shape"])
+
+
+    def query(self, query: str, top_k: int) -> List[SearchResult]:
+        response, _ = self._call({"op": "query", "query": query, "top_k": top_k})
+        return [(name, score) for name, score in response["results"]]
+
+
+class MicroBatcher:
+    """Coalesces concurrent encode requests into few model calls."""
+
+    def __init__(self, index: SemanticIndex, max_batch: int = MAX_BATCH, max_wait: float = MAX_WAIT) -> None:
+        self.index = index
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue: asyncio.Queue[Tuple[List[str], asyncio.Future]] = asyncio.Queue()
+
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch and (remaining := deadline - loop.time()) > 0:
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            texts = [t for texts, _ in batch for t in texts]
+            try:
+                embeddings = await asyncio.to_thread(self.index.local_encode, texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for texts_, future in batch:
+                future.set_result(embeddings[offset:offset + len(texts_)])
+                offset += len(texts_)
+
+
+class EmbeddingServer:
+
+    def __init__(self, index: SemanticIndex, batcher: MicroBatcher) -> None:
+        self.index = index
+        self.batcher = batcher
+
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head_len, payload_len = FRAME.unpack(await reader.readexactly(FRAME.size))
+                request = json.loads(await reader.readexactly(head_len))
+                await reader.readexactly(payload_len)
+                writer.write(await self.respond(request))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+    async def respond(self, request: Dict[str, Any]) -> bytes:
+        try:
+            if request["op"] == "encode":
+                embeddings = await self.batcher.encode(request["texts"])
+                return pack({"ok": True, "shape": list(embeddings.shape)}, embeddings.tobytes())
+            if request["op"] == "query":
+                embedding = await self.batcher.encode([request["query"]])
+                results = await asyncio.to_thread(self.index.local_search, embedding, request["top_k"])
+                return pack({"ok": True, "results": results})
+            return pack({"ok": False, "error": f"unknown op {request['op']!r}"})
+        except Exception as e:
+            return pack({"ok": False, "error": repr(e)})
+
+
+async def serve(index: SemanticIndex, socket_path: str, max_batch: int = MAX_BATCH, max_wait: float = MAX_WAIT) -> None:
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    batcher = MicroBatcher(index, max_batch, max_wait)
+    server = EmbeddingServer(index, batcher)
+    batching = asyncio.create_task(batcher.run())
+    try:
+        async with await asyncio.start_unix_server(server.handle, path=socket_path) as srv:
+            print(f"Embedding sidecar listening on {socket_path}")
+            await srv.serve_forever()
+    finally:
+        batching.cancel()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Shared embedding and index search sidecar.")
+    parser.add_argument("--socket", default="/tmp/properly-embed.sock")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT * 1000)
+    args = parser.parse_args()
+
+    from .embeddings import SemanticIndex
+    index = SemanticIndex(socket_path=None)  # the sidecar always owns the model
+    index.load()
+    asyncio.run(serve(index, args.socket, args.max_batch, args.max_wait_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
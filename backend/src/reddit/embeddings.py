@@ -1,16 +1,28 @@
 from __future__ import annotations
-import faiss  # type: ignore
+import os
+import threading
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
 # --- Types ---
-from typing import Sequence, Tuple, List, Optional
+from typing import Sequence, Tuple, List, Optional, TYPE_CHECKING
 from pathlib import Path
 
+from ..metrics import record_cache
+from ..tracing import traced
+from .embed_service import EmbeddingClient
+
+if TYPE_CHECKING:
+    import faiss  # type: ignore
+    from sentence_transformers import SentenceTransformer
+
 Subreddit = str
 SearchResult = Tuple[Subreddit, float]
 IndexPath = str
 
+# When set, encoding and index search are delegated to the shared sidecar
+# listening on this Unix socket (see `embed_service.py`).
+EMBED_SOCKET: Optional[str] = os.getenv("PROPERLY_EMBED_SOCKET")
+
 
 class SemanticIndex:
     """
@@ -19,15 +31,23 @@ class SemanticIndex:
       - Default model is `all-MiniLM-L6-v2`, which maps sentences & paragraphs to
     a 384 dimensional dense vector space and can be used for tasks like clustering or semantic search.
       - Default output files are `subreddits.index` and `subredditsNames.npy`
+      - With a `socket_path` the model and the index live in the embedding sidecar, and this
+    object is only its client: torch, the model and FAISS are never loaded in this process.
     """
 
     def __init__(
         self,
         model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
         index_file: IndexPath = "subreddits.index",
-        names_file: str = "subredditsNames.npy") -> None:
-        
-        self.model: SentenceTransformer = SentenceTransformer(model_name)
+        names_file: str = "subredditsNames.npy",
+        socket_path: Optional[str] = EMBED_SOCKET) -> None:
+
+        self.remote: Optional[EmbeddingClient] = EmbeddingClient(socket_path) if socket_path else None
+
+        self.model: Optional[SentenceTransformer] = None
+        if self.remote is None:
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(model_name)
 
         module_dir = Path(__file__).parent
         self.index_file: IndexPath = str(module_dir / index_file)
@@ -36,7 +56,7 @@ class SemanticIndex:
         # caching the index to avoid reloading it in query() method
         self._index_cache: Optional[faiss.Index] = None
         self._names_cache: Optional[np.ndarray]  = None
-        
+
 
     def build(self, subreddits: Sequence[Subreddit]) -> None:
         """
@@ -45,10 +65,9 @@ class SemanticIndex:
 
         TODO: We should add subreddit metadata to improve the semantic embedding in the vector space
         """
-        embeddings: np.ndarray = self.model.encode(
-            list(subreddits), convert_to_tensor=True
-        ).cpu().numpy()
-        faiss.normalize_L2(embeddings)
+        import faiss  # type: ignore
+
+        embeddings: np.ndarray = self.local_encode(list(subreddits))
 
         d: int = embeddings.shape[1]
         index: faiss.Index = faiss.IndexFlatIP(d)
@@ -63,30 +82,68 @@ class SemanticIndex:
         Load an existing FAISS index and subreddit names from disk,
         or return cached index and names.
         """
+        import faiss  # type: ignore
+
+        record_cache("subreddit_index", hit=self._index_cache is not None)
         if not self._index_cache:
             self._index_cache = faiss.read_index(self.index_file)
             self._names_cache = np.load(self.names_file, allow_pickle=True)
-        
+
         if self._index_cache is None or self._names_cache is None:
             raise RuntimeError("failed to load subreddits index or names from disk")
-        
+
         return self._index_cache, self._names_cache
-        
+
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Embed texts as L2-normalized float32 rows, so that a dot product is a cosine similarity.
+        """
+        with traced("encode", "model", texts=len(texts), remote=self.remote is not None):
+            if self.remote is not None:
+                return self.remote.encode(texts)
+            return self.local_encode(texts)
+
 
     def query(self, query: str, top_k: int) -> List[SearchResult]:
         """
         Query the index for the most semantically similar subreddits to a given query.
         Returns a list of (subreddit, similarity_score).
         """
-        index, subreddits = self.load()
+        if self.remote is not None:
+            with traced("query", "model", remote=True):
+                return self.remote.query(query, top_k)
+        return self.local_search(self.encode([query]), top_k)
 
-        query_emb: np.ndarray = self.model.encode(
-            [query], convert_to_tensor=True
-        ).cpu().numpy()
-        faiss.normalize_L2(query_emb)
+
+    # --- in-process model, used directly or by the sidecar ---
+
+    def local_encode(self, texts: Sequence[str]) -> np.ndarray:
+        if self.model is None:
+            raise RuntimeError("this SemanticIndex is a sidecar client, it has no local model")
+        embeddings: np.ndarray = self.model.encode(
+            list(texts), convert_to_numpy=True, normalize_embeddings=True
+        )
+        return embeddings.astype(np.float32, copy=False)
+
+
+    def local_search(self, query_emb: np.ndarray, top_k: int) -> List[SearchResult]:
+        index, subreddits = self.load()
 
         D: np.ndarray
         I: np.ndarray
         D, I = index.search(query_emb, top_k)  # type: ignore
 
         return [(str(subreddits[i]), float(D[0][j])) for j, i in enumerate(I[0])]
+
+
+_shared: Optional[SemanticIndex] = None
+_shared_lock = threading.Lock()
+
+def shared_index() -> SemanticIndex:
+    """Process-wide SemanticIndex, so that every source shares one model (or sidecar client)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = SemanticIndex()
+        return _shared
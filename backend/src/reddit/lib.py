@@ -1,51 +1,119 @@
-import requests
 import socket
+import threading
+import urllib3
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import (
+    ConnectTimeoutError, HTTPError, NameResolutionError, NewConnectionError, ProtocolError, ReadTimeoutError
+)
 from urllib.parse import urlparse, ParseResult
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Iterable, Set
-    
+from typing import Dict, Iterable, List, Optional, Set
 
-def check_ping(url: str, timeout: int = 1) -> bool:
-    """Check if the server accepts TCP connections.
-    Careful: this function doesn't guarantee valid HTTP, only tests TCP handshake.
-    """
-    try:
-        parsed: ParseResult = urlparse(url)
-        host: str | None    = parsed.hostname
-        port: int = 443 if parsed.scheme == "https" else 80
-        with socket.create_connection((host, port), timeout=timeout):
-            return True
-    except Exception:
-        return False
+from .const import URL_RE
+from ..resolver import dns_cache
+from ..breaker import hosts
+from ..cancel import check
+from ..tracing import traced, propagate
     
 
-def http_alive(url: str, timeout: int = 2) -> bool:
-    """Lightweight HTTP check — HEAD first, fallback to GET if needed."""
-    try:
-        with requests.head(url, timeout=timeout, allow_redirects=True) as r:
-            if r.status_code == 405:
-                # case: head not supported
-                with requests.get(url, stream=True, timeout=timeout) as r2:
-                    return r2.status_code < 400
-            return r.status_code < 400
-    except requests.RequestException:
-        return False
+def find_urls(text: str) -> List[str]:
+    """Links in a post or comment body, without trailing (markdown) punctuation."""
+    return [url.strip(").,]") for url in URL_RE.findall(text)]
+
+
+class CachedDNSConnection(HTTPConnection):
+    """urllib3 connection resolving its host through the shared DNS cache."""
+
+    def _new_conn(self) -> socket.socket:
+        try:
+            with traced("connect", "tcp", host=self.host):
+                return dns_cache.create_connection(
+                    (self._dns_host, self.port), self.timeout, socket_options=self.socket_options
+                )
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        except socket.timeout as e:
+            raise ConnectTimeoutError(self, f"Connection to {self.host} timed out") from e
+        except OSError as e:
+            raise NewConnectionError(self, f"Failed to establish a new connection: {e}") from e
+
+
+class CachedDNSHTTPSConnection(CachedDNSConnection, HTTPSConnection):
+    pass
+
+
+class CachedDNSPool(HTTPConnectionPool):
+    ConnectionCls = CachedDNSConnection
 
 
-def islive(url: str, tcp_timeout=1, http_timeout=2) -> bool:
-    """Check if a link is live (returns True) or not (returns False)"""
-    if not check_ping(url, tcp_timeout):
+class CachedDNSHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = CachedDNSHTTPSConnection
+
+
+# One pool per host, shared by all liveness checks: connections are kept alive
+# between checks of urls on the same host.
+POOL = urllib3.PoolManager(num_pools=256, maxsize=4, headers={"User-Agent": "Mozilla/5.0"})
+POOL.pool_classes_by_scheme = {"http": CachedDNSPool, "https": CachedDNSHTTPSPool}
+
+# No retries, as with `requests`, but follow redirects
+RETRIES = urllib3.Retry(total=None, connect=0, read=0, status=0, other=0, redirect=5)
+
+
+def islive(url: str, tcp_timeout=1, http_timeout=2) -> Optional[bool]:
+    """
+    Check if a link is live (returns True) or not (returns False); None when unknown,
+    the host's circuit breaker being open (see `breaker.py`).
+    One handshake per url: the TCP connect (bounded by `tcp_timeout`, host resolved through
+    the DNS cache) is also the connection the HEAD, and the GET fallback, are sent on.
+    """
+    parsed: ParseResult = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return False
+    host = parsed.hostname
+    breaker = hosts.get(host)
+    if not breaker.allow():
+        return None
+    timeout = urllib3.Timeout(connect=tcp_timeout, read=http_timeout)
+    try:
+        with traced("HEAD", "http", host=host) as sp:
+            r = POOL.request("HEAD", url, timeout=timeout, retries=RETRIES)
+            sp.set("status", r.status)
+        if r.status == 405:
+            # case: head not supported; the body is not read, so the connection is not reused
+            with traced("GET", "http", host=host) as sp:
+                r = POOL.request("GET", url, timeout=timeout, retries=RETRIES, preload_content=False)
+                sp.set("status", r.status)
+                r.close()
+                r.release_conn()
+        breaker.record(True)
+        return r.status < 400
+    except (HTTPError, ValueError) as e:
+        # unreachable or unresponsive host, as opposed to e.g. too many redirects
+        if isinstance(getattr(e, "reason", None) or e, (NewConnectionError, ConnectTimeoutError, ReadTimeoutError, ProtocolError)):
+            breaker.record(False)
+        else:
+            breaker.release()
         return False
-    return http_alive(url, http_timeout)
 
 
-def filter_live_urls(urls: Iterable[str], max_workers: int = 10) -> Set[str]:
+def check_live_urls(urls: Iterable[str], max_workers: int = 10, stop: Optional[threading.Event] = None) -> Dict[str, Optional[bool]]:
     """
-    Filter URLs, keeping only live ones. Returns a set of live URLs.
-    Uses parallel execution for performance.
+    Check URLs in parallel: {url: live, dead (False) or unknown (None)}, see `islive`.
+    Once `stop` is set, checks not yet started are dropped and `Cancelled` is raised.
     
     TODO: make timeout a parameter
     """
+    def is_live(url: str) -> Optional[bool]:
+        check(stop)
+        return islive(url)
+
+    work = propagate(is_live)
     with ThreadPoolExecutor(max_workers=max_workers) as pool:
-        futures = {pool.submit(islive, url): url for url in urls}
-        return {futures[f] for f in as_completed(futures) if f.result()}
\ No newline at end of file
+        futures = {pool.submit(work, url): url for url in urls}
+        return {futures[f]: f.result() for f in as_completed(futures)}
+
+
+def filter_live_urls(urls: Iterable[str], max_workers: int = 10, stop: Optional[threading.Event] = None) -> Set[str]:
+    """Filter URLs, keeping only live ones. Returns a set of live URLs."""
+    return {url for url, live in check_live_urls(urls, max_workers, stop).items() if live}
\ No newline at end of file
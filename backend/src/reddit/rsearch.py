@@ -1,37 +1,53 @@
 import os
-import re
+import threading
+from dataclasses import replace
 
 from dotenv import load_dotenv
-from typing import List
+from typing import List, Optional
 
 from praw import Reddit # type: ignore
 from praw.models import Submission, Subreddit # type: ignore
-from torch import Tensor, cosine_similarity
+from prawcore.exceptions import RequestException, ServerError, TooManyRequests # type: ignore
 from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
 # internal lib
-from .lib import filter_live_urls
-from .embeddings import SemanticIndex
+from .lib import check_live_urls, find_urls
+from .cache import ThreadCache
+from .dumps import OfflineIndex, offline_index
+from .embeddings import shared_index
 from .const import EDU_SUBREDDITS
+from ..resource import Resource
+from ..metrics import span, record_liveness
+from ..tracing import propagate
+from ..cancel import check
+from ..policy import call, POLICIES
 
 
 def reddit_client() -> Reddit:
-    """Create a read-only reddit instance."""
+    """Create a read-only reddit instance.
+    `REDDIT_OAUTH_URL` and `REDDIT_URL` redirect the client (e.g. to local load-test stubs).
+    """
     load_dotenv()
     reddit = Reddit(
         client_id = os.getenv("REDDIT_CLIENT_ID"),
         client_secret = os.getenv("REDDIT_CLIENT_SECRET"),
-        user_agent = os.getenv("REDDIT_USER_AGENT")
+        user_agent = os.getenv("REDDIT_USER_AGENT"),
+        timeout = int(POLICIES["reddit"].attempt_timeout), # PRAW's timeout is per client, not per call
+        oauth_url = os.getenv("REDDIT_OAUTH_URL", "https://oauth.reddit.com"), # PRAW defaults
+        reddit_url = os.getenv("REDDIT_URL", "https://www.reddit.com"),
     )
     return reddit
 
-semantic = SemanticIndex()
+semantic = shared_index()
+threads = ThreadCache()
 
 def get_subreddits(query: str, n: int) -> List[str]:
     """Returns a list of n subreddits that have high semantic similarity
     with the user query.
     """
-    results = semantic.query(query, top_k=n)
+    with span("reddit", "embedding"):
+        results = semantic.query(query, top_k=n)
     return [sub for sub, _ in results]
 
 
@@ -39,58 +55,97 @@ def get_posts(rinstance: Reddit, sub: str, query: str, n: int) -> List[Submissio
     """
     Given a subreddit, extract n post that match the query using reddit search.
 
-    TODO: Find a *fast* way to further rank posts by semantic similarity to the query. We can't build
-    another faiss index while running (?), but we can't either rely solely on reddit search. 
+    Posts returned by reddit search are re-ranked by semantic similarity to the query.
     """
     subreddit: Subreddit = rinstance.subreddit(sub)
 
     query_new: str = "Resources to learn " + query
-    equery: Tensor = semantic.model.encode(query_new, convert_to_tensor=True)
-    
-    posts: List[Submission] = [
-        post for post in subreddit.search(query_new, sort="relevance", limit=(3 * n))
-    ]
-    return sorted(posts, key=lambda p: scoring(equery, p), reverse=True)[:n]
 
+    def attempt(_timeout: float) -> List[Submission]:
+        return list(subreddit.search(query_new, sort="relevance", limit=(3 * n)))
+
+    with span("reddit", "upstream"):
+        posts: List[Submission] = call(
+            "reddit", attempt, lambda e: isinstance(e, (RequestException, ServerError, TooManyRequests))
+        )
 
-def scoring(equery: Tensor, post: Submission) -> float:
-    """Score a single post against pre-computed query embedding.
+    with span("reddit", "embedding"):
+        scores = scoring(query_new, posts)
+    return [posts[i] for i in np.argsort(-scores, kind="stable")[:n]]
+
+
+def scoring(query: str, posts: List[Submission]) -> np.ndarray:
+    """Cosine similarity of every post to the query, with a single (batched) encode call.
     """
-    text: str = post.title + ": " + post.selftext
-    etext: Tensor = semantic.model.encode(text, convert_to_tensor=True)
-    similarity: Tensor = cosine_similarity(etext, equery, dim=0)
-    return similarity.item()
+    if not posts:
+        return np.zeros(0, dtype=np.float32)
+    texts: List[str] = [query] + [post.title + ": " + post.selftext for post in posts]
+    embeddings: np.ndarray = semantic.encode(texts)
+    return embeddings[1:] @ embeddings[0]
 
 
-def get_resources(post: Submission) -> List[str]:
-    """Get resources (links only at the moment) from a post.
+def extract_links(post: Submission) -> List[str]:
+    """Links found in the top comments of a post, without duplicates,
+    ordered by the score of the comment they appear in.
+    """
+    with span("reddit", "upstream"):
+        post.comments.replace_more(limit=1) # Expands only the top level of MoreComments
+        comments : list = post.comments.list()[:50] # cap comments checked
+
+    urls = (url
+            for comment in sorted(comments, key=lambda c: c.score, reverse=True)
+            for url in find_urls(comment.body))
+    return list(dict.fromkeys(urls))
+
+
+def get_resources(post: Submission, verify: bool = True, stop: Optional[threading.Event] = None) -> List[str]:
+    """Get resources (links only at the moment) from a post, best first.
     Internally, it checks that the link is not dead.
 
+    Links of a thread are cached (see `cache.py`): the thread is re-crawled only
+    when its comment count changed or the cached entry expired.
+    With `verify=False` freshly extracted links are returned unchecked (and not cached).
+    Once `stop` is set the checks are dropped, with `Cancelled`, and nothing is cached.
+    Nor is it when a link's liveness is unknown (its host's circuit breaker is open).
+
     TODO: even suggested books in the comments should be retrieved.
     """
-    re_url: str = r'(https?://\S+)'
-    
-    post.comments.replace_more(limit=1) # Expands only the top level of MoreComments
-    comments : list = post.comments.list()[:50] # cap comments checked
+    cached = threads.get(post.id, post.num_comments)
+    if cached is not None:
+        return list(cached.links)
+
+    candidates = extract_links(post)
+    if not verify:
+        return candidates
 
-    # Collect all URLs first
-    urls = (url.strip(").,]")
-            for comment in sorted(comments, key=lambda c: c.score, reverse=True)
-            for url in re.findall(re_url, comment.body))
-    
     # Filter in parallel
-    # TODO: I think here we are losing ordering of links, order is important to have best links ontop!!
-    return list(filter_live_urls(set(urls), max_workers=30))
+    with span("reddit", "liveness"):
+        checked = check_live_urls(candidates, max_workers=30, stop=stop)
+    links = tuple(url for url in candidates if checked[url])
+    record_liveness("reddit", checked.values())
+
+    if None not in checked.values():
+        threads.put(post.id, post.num_comments, links)
+    return list(links)
 
 
-def get_all_resources(query: str, no_subreddits: int = 2, no_posts: int = 4) -> list[str]:
+def get_all_resources(query: str, no_subreddits: int = 2, no_posts: int = 4, verify: bool = True, stop: Optional[threading.Event] = None) -> list[Resource]:
     """
     Main entrance point, where:
       - query: user search term
       - no_subreddits: number of subreddits you want for the rsearch
       - no_posts: number of posts per subreddit to use as links source
-      - returns the list of links obtained
+      - verify: check links are live (see `get_resources`)
+      - stop: set when the search is cancelled, the work not yet started is dropped (see `cancel.py`)
+      - returns the links obtained, as untitled resources
+
+    With `PROPERLY_REDDIT_INDEX` set, posts and links come from the offline index
+    built from Reddit dumps (see `dumps.py`) and Reddit is never called.
     """
+    offline = offline_index()
+    if offline is not None:
+        return get_offline_resources(offline, query, no_subreddits * no_posts, verify, stop)
+
     rinstance : Reddit = reddit_client()
     subreddits : list[str] = get_subreddits(query, no_subreddits)
 
@@ -101,17 +156,33 @@ def get_all_resources(query: str, no_subreddits: int = 2, no_posts: int = 4) ->
         """Helper function to fetch posts per subreddit and extract
         resources (links).
         """
+        check(stop)
         posts: list[Submission] = get_posts(rinstance, sub, query, no_posts)
         resources = []
         for post in posts:
-            links: list[str] = get_resources(post)
+            check(stop)
+            links: list[str] = get_resources(post, verify, stop)
             resources.extend(links)
         return resources
     
     with ThreadPoolExecutor(max_workers=10) as executor:
-        results = executor.map(fetch, subreddits)
+        results = executor.map(propagate(fetch), subreddits)
     
-    return [link for links in results for link in links]
+    return [Resource("reddit", None, link, verified=verify) for links in results for link in links]
+
+
+def get_offline_resources(offline: OfflineIndex, query: str, no_posts: int, verify: bool, stop: Optional[threading.Event] = None) -> list[Resource]:
+    """Links of the `no_posts` indexed posts closest to the query, live ones only with `verify`."""
+    with span("reddit", "embedding"):
+        candidates = list(dict.fromkeys(offline.search(query, no_posts)))
+    if not verify:
+        return candidates
+
+    urls = [r.url for r in candidates]
+    with span("reddit", "liveness"):
+        checked = check_live_urls(urls, max_workers=30, stop=stop)
+    record_liveness("reddit", checked.values())
+    return [replace(r, verified=True) for r in candidates if checked[r.url]]
 
 
 
@@ -125,5 +196,5 @@ if __name__ == "__main__":
         sys.exit(0)
 
     user_query : str = input("What do you want to learn?\n")
-    links : List[str]= get_all_resources(query=user_query)
-    print("Got these:\n", links)
+    links : List[Resource] = get_all_resources(query=user_query)
+    print("Got these:\n", [r.url for r in links])
@@ -0,0 +1,101 @@
+"""
+Process-wide DNS cache, shared by every thread doing outbound link checks.
+
+Each liveness probe used to resolve its host with a blocking `getaddrinfo`,
+for every step of the check. Here answers are kept for `ttl` seconds, and
+NXDOMAIN answers for `negative_ttl` seconds, so that dead domains fail fast.
+Transient resolver errors (e.g. EAI_AGAIN) are never cached.
+
+The stdlib resolver does not expose record TTLs, so both are configured:
+`PROPERLY_DNS_TTL` and `PROPERLY_DNS_NEGATIVE_TTL` (seconds).
+"""
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple, Union
+
+from .metrics import record_cache
+
+AddrInfo = Tuple[Any, ...]
+
+TTL = float(os.getenv("PROPERLY_DNS_TTL", 300))
+NEGATIVE_TTL = float(os.getenv("PROPERLY_DNS_NEGATIVE_TTL", 60))
+MAX_ENTRIES = 4096
+
+# "no such host": what getaddrinfo reports for NXDOMAIN (EAI_NODATA is not defined everywhere)
+NXDOMAIN = {socket.EAI_NONAME, getattr(socket, "EAI_NODATA", socket.EAI_NONAME)}
+
+
+class DnsCache:
+    """Thread-safe, bounded (least recently used first out) cache of `getaddrinfo` answers."""
+
+    def __init__(self, ttl: float = TTL, negative_ttl: float = NEGATIVE_TTL, max_entries: int = MAX_ENTRIES) -> None:
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, int, int], Tuple[float, Union[List[AddrInfo], socket.gaierror]]]" = OrderedDict()
+
+
+    def getaddrinfo(self, host: str, port: int, family: int = socket.AF_UNSPEC) -> List[AddrInfo]:
+        """Like `socket.getaddrinfo(host, port, family, SOCK_STREAM)`, raising `socket.gaierror` alike."""
+        key = (host, port, family)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+            else:
+                entry = None
+        record_cache("dns", hit=entry is not None)
+
+        if entry is None:
+            try:
+                answer: Union[List[AddrInfo], socket.gaierror] = socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+                entry = (now + self.ttl, answer)
+            except socket.gaierror as e:
+                if e.errno not in NXDOMAIN:
+                    raise
+                entry = (now + self.negative_ttl, e)
+            self._put(key, entry)
+
+        answer = entry[1]
+        if isinstance(answer, socket.gaierror):
+            raise socket.gaierror(answer.errno, answer.strerror)
+        return answer
+
+
+    def create_connection(
+        self,
+        address: Tuple[str, int],
+        timeout: Optional[float] = None,
+        family: int = socket.AF_UNSPEC,
+        socket_options: Optional[List[Tuple[int, int, Union[int, bytes]]]] = None) -> socket.socket:
+        """`socket.create_connection` resolving through the cache: tries each address in turn."""
+        host, port = address
+        err: Optional[OSError] = None
+        for af, socktype, proto, _, sa in self.getaddrinfo(host.strip("[]"), port, family):
+            sock = socket.socket(af, socktype, proto)
+            try:
+                for opt in socket_options or []:
+                    sock.setsockopt(*opt)
+                sock.settimeout(timeout)
+                sock.connect(sa)
+                return sock
+            except OSError as e:
+                err = e
+                sock.close()
+        raise err or OSError(f"getaddrinfo returned no address for {host}")
+
+
+    def _put(self, key: Tuple[str, int, int], entry: Tuple[float, Any]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+dns_cache = DnsCache()
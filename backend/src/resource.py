@@ -0,0 +1,39 @@
+"""
+The resource model shared by every source, the store and the API.
+
+Slotted, so that large responses don't carry a `__dict__` per result, and
+serialized as it is by orjson (which encodes dataclasses natively): events go
+on the wire as JSON lines without formatting each resource into text first.
+"""
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import orjson
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Resource:
+    """
+    - source: "wiki", "reddit", "hn", "arxiv"
+    - score: source specific relevance (e.g. Algolia points, then the HN ranking score)
+    - verified: the link was checked to be live (or comes from a trusted API);
+    False for candidates streamed in fast mode before their check.
+    Resources are equal when their url is.
+    """
+    source: str
+    title: Optional[str]
+    url: str
+    description: Optional[str] = None
+    score: Optional[float] = None
+    verified: bool = True
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Resource) and self.url == other.url
+
+    def __hash__(self) -> int:
+        return hash(self.url)
+
+
+def dumps(event: Any) -> bytes:
+    """One JSON line of the `/search` stream."""
+    return orjson.dumps(event, option=orjson.OPT_APPEND_NEWLINE)
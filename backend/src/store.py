@@ -0,0 +1,270 @@
+"""
+Persistent store of verified resources, backed by SQLite with an FTS5 index.
+
+Every resource that `search_stream` emits is recorded together with its source,
+the query that found it, a score and timestamps. Later searches can then answer
+instantly from resources that were verified recently, while the live fan-out runs.
+
+The store is bounded: rows not re-verified within `retention` seconds are dropped,
+and beyond `max_rows` the least recently verified rows are evicted first.
+
+It also counts how often each query is searched, which drives the prefetcher.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .resource import Resource
+
+DB_PATH = os.getenv("PROPERLY_STORE", str(Path(__file__).parent / "resources.db"))
+MAX_ROWS = 50_000
+RETENTION = 30 * 24 * 3600   # seconds
+FRESH_FOR = 24 * 3600        # seconds a verification is trusted for instant answers
+EVICT_EVERY = 100            # writes between eviction passes
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    id          INTEGER PRIMARY KEY,
+    url         TEXT NOT NULL UNIQUE,
+    source      TEXT NOT NULL,
+    title       TEXT,
+    description TEXT,
+    query       TEXT,
+    score       REAL,
+    first_seen  REAL NOT NULL,
+    verified_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS resources_verified_at ON resources(verified_at);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS resources_fts USING fts5(
+    title, description, query, content='resources', content_rowid='id'
+);
+
+CREATE TRIGGER IF NOT EXISTS resources_ai AFTER INSERT ON resources BEGIN
+    INSERT INTO resources_fts(rowid, title, description, query)
+    VALUES (new.id, new.title, new.description, new.query);
+END;
+CREATE TRIGGER IF NOT EXISTS resources_ad AFTER DELETE ON resources BEGIN
+    INSERT INTO resources_fts(resources_fts, rowid, title, description, query)
+    VALUES ('delete', old.id, old.title, old.description, old.query);
+END;
+CREATE TABLE IF NOT EXISTS queries (
+    query          TEXT PRIMARY KEY,
+    hits           INTEGER NOT NULL,
+    last_seen      REAL NOT NULL,
+    last_refreshed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS queries_last_seen ON queries(last_seen);
+
+-- held by one of the processes sharing the store, e.g. the prefetcher of one API worker
+CREATE TABLE IF NOT EXISTS leases (
+    name    TEXT PRIMARY KEY,
+    holder  TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS resources_au AFTER UPDATE ON resources BEGIN
+    INSERT INTO resources_fts(resources_fts, rowid, title, description, query)
+    VALUES ('delete', old.id, old.title, old.description, old.query);
+    INSERT INTO resources_fts(rowid, title, description, query)
+    VALUES (new.id, new.title, new.description, new.query);
+END;
+"""
+
+
+def normalize(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def fts_query(text: str) -> Optional[str]:
+    """Turn free text into an FTS5 expression matching any of its words."""
+    words = re.findall(r"\w+", text.lower())
+    return " OR ".join(f'"{w}"' for w in words) if words else None
+
+
+class ResourceStore:
+    """
+    Thread-safe wrapper around a single SQLite connection: writes come from
+    worker threads, reads from the request path.
+    """
+
+    def __init__(self, path: str = DB_PATH, max_rows: int = MAX_ROWS, retention: float = RETENTION) -> None:
+        self.max_rows = max_rows
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Explicit transaction (the connection is in autocommit mode); caller holds the lock.
+        Rolled back on error, so that the shared connection is not left inside it."""
+        self._conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+
+    def record(self, query: str, resources: Iterable[Resource]) -> None:
+        """Insert or refresh resources verified just now (unverified ones are skipped)."""
+        now = time.time()
+        query = normalize(query)
+        rows = [
+            (r.url, r.source, r.title, r.description, query, r.score, now, now)
+            for r in resources if r.url and r.verified
+        ]
+        if not rows:
+            return
+        with self._lock:
+            with self._transaction():
+                self._conn.executemany(
+                    """
+                    INSERT INTO resources (url, source, title, description, query, score, first_seen, verified_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(url) DO UPDATE SET
+                        title       = coalesce(excluded.title, title),
+                        description = coalesce(excluded.description, description),
+                        query       = excluded.query,
+                        score       = coalesce(excluded.score, score),
+                        verified_at = excluded.verified_at
+                    """,
+                    rows,
+                )
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict(now)
+
+
+    def track_query(self, query: str) -> None:
+        """Count a user search; it ran the live fan-out, so its results are fresh too."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO queries (query, hits, last_seen, last_refreshed) VALUES (?, 1, ?, ?)
+                ON CONFLICT(query) DO UPDATE SET
+                    hits = hits + 1, last_seen = excluded.last_seen, last_refreshed = excluded.last_refreshed
+                """,
+                (normalize(query), now, now),
+            )
+
+
+    def mark_refreshed(self, query: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE queries SET last_refreshed = ? WHERE query = ?", (time.time(), normalize(query))
+            )
+
+
+    def last_search(self) -> float:
+        """When the last user search started, in any process sharing the store (0 if never)."""
+        with self._lock:
+            (last,) = self._conn.execute("SELECT coalesce(max(last_seen), 0) FROM queries").fetchone()
+        return last
+
+
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        """Take or renew the lease `name` for `ttl` seconds; False while another holder has it."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO leases (name, holder, expires) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires = excluded.expires
+                WHERE leases.holder = excluded.holder OR leases.expires < ?
+                """,
+                (name, holder, now + ttl, now),
+            )
+            (owner,) = self._conn.execute("SELECT holder FROM leases WHERE name = ?", (name,)).fetchone()
+        return owner == holder
+
+
+    def due_queries(self, n: int, refresh_after: float, active_within: float = RETENTION) -> List[str]:
+        """
+        The `n` most searched queries, among those searched within `active_within` seconds,
+        whose results were last refreshed more than `refresh_after` seconds ago.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT query FROM queries
+                WHERE last_seen >= ? AND last_refreshed <= ?
+                ORDER BY hits DESC LIMIT ?
+                """,
+                (now - active_within, now - refresh_after, n),
+            ).fetchall()
+        return [q for (q,) in rows]
+
+
+    def stale_urls(self, query: str, older_than: float) -> List[str]:
+        """Urls found by `query` that were not verified in the last `older_than` seconds."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url FROM resources WHERE query = ? AND verified_at < ?",
+                (normalize(query), time.time() - older_than),
+            ).fetchall()
+        return [u for (u,) in rows]
+
+
+    def reverify(self, urls: Iterable[str], live: Iterable[str], meta: Dict[str, Optional[str]]) -> None:
+        """Refresh live urls (and their descriptions when one was fetched), drop dead ones."""
+        now = time.time()
+        live_set = set(live)
+        with self._lock, self._transaction():
+            for url in urls:
+                if url in live_set:
+                    self._conn.execute(
+                        "UPDATE resources SET verified_at = ?, description = coalesce(?, description) WHERE url = ?",
+                        (now, meta.get(url), url),
+                    )
+                else:
+                    self._conn.execute("DELETE FROM resources WHERE url = ?", (url,))
+
+
+    def search(self, query: str, limit: int = 10, max_age: float = FRESH_FOR) -> List[Resource]:
+        """Best full-text matches among resources verified within `max_age` seconds."""
+        match = fts_query(query)
+        if match is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT r.source, r.title, r.url, r.description, r.score
+                FROM resources_fts JOIN resources r ON r.id = resources_fts.rowid
+                WHERE resources_fts MATCH ? AND r.verified_at >= ?
+                ORDER BY resources_fts.rank
+                LIMIT ?
+                """,
+                (match, time.time() - max_age, limit),
+            ).fetchall()
+        return [Resource(*row) for row in rows]
+
+
+    def _evict(self, now: float) -> None:
+        """Apply retention, then cap the table size. Caller holds the lock."""
+        self._conn.execute("DELETE FROM resources WHERE verified_at < ?", (now - self.retention,))
+        (count,) = self._conn.execute("SELECT count(*) FROM resources").fetchone()
+        if count > self.max_rows:
+            self._conn.execute(
+                "DELETE FROM resources WHERE id IN "
+                "(SELECT id FROM resources ORDER BY verified_at LIMIT ?)",
+                (count - self.max_rows,),
+            )
+
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,245 @@
+"""
+Opt-in per-request tracing and sampling profiler.
+
+A trace is bound to the request through a context variable, so it follows the request
+into asyncio tasks and `asyncio.to_thread`; thread pools need their work items wrapped
+with `propagate`. Finished traces are exported in the Chrome trace format (open them
+in chrome://tracing or https://ui.perfetto.dev) and kept in a small in-memory store.
+
+When no trace is active every helper returns immediately, so instrumentation can stay
+in the hot paths.
+"""
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar, copy_context
+from types import CodeType
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+MAX_STORED_TRACES = 32
+SAMPLE_INTERVAL = 0.005  # seconds between profiler samples
+MAX_SAMPLES = 20_000     # per trace; the profiler stops once reached
+
+Stack = Tuple[Tuple[CodeType, int], ...]  # (code, line) pairs, outermost first
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("properly_trace", default=None)
+
+
+class Trace:
+    """Timeline of one request plus stack samples of the threads it ran on."""
+
+    def __init__(self, request_id: str, name: str) -> None:
+        self.request_id = request_id
+        self.name = name
+        self.origin = time.perf_counter()
+        self.events: List[Dict[str, Any]] = []
+        self.samples: List[Tuple[float, int, Stack]] = []
+        self.threads: Dict[int, str] = {}
+        self.active: Dict[int, int] = {}  # thread -> nesting of this request's work running on it
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name=f"trace-{request_id}", daemon=True)
+
+    def now_us(self) -> float:
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def add(self, event: Dict[str, Any]) -> None:
+        thread = threading.current_thread()
+        event.setdefault("pid", 1)
+        event.setdefault("tid", thread.ident)
+        with self._lock:
+            self.threads[thread.ident or 0] = thread.name
+            self.events.append(event)
+
+    def enter(self) -> None:
+        """The current thread starts running work of this request (a span, or the whole request)."""
+        thread = threading.current_thread()
+        tid = thread.ident or 0
+        with self._lock:
+            self.threads[tid] = thread.name
+            self.active[tid] = self.active.get(tid, 0) + 1
+
+    def leave(self) -> None:
+        tid = threading.get_ident()
+        with self._lock:
+            if self.active.get(tid, 0) > 1:
+                self.active[tid] -= 1
+            else:
+                self.active.pop(tid, None)
+
+    def _sample(self) -> None:
+        """
+        Sample the stacks of the threads running this request's work, so that the cost
+        does not grow with the server load: shared pool threads are only sampled while
+        inside one of its spans. Frames are formatted at export.
+        """
+        while not self._stop.wait(SAMPLE_INTERVAL) and len(self.samples) < MAX_SAMPLES:
+            ts = self.now_us()
+            with self._lock:
+                tids = list(self.active)
+            frames = sys._current_frames()
+            for tid in tids:
+                f: Any = frames.get(tid)
+                stack = []
+                while f is not None:
+                    stack.append((f.f_code, f.f_lineno))
+                    f = f.f_back
+                if stack:
+                    self.samples.append((ts, tid, tuple(reversed(stack))))
+
+    def start(self) -> None:
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._sampler.join()
+
+    def to_chrome(self) -> Dict[str, Any]:
+        """Export as Chrome trace JSON (trace events + sampled stack frames)."""
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+
+        frames: Dict[str, Dict[str, Any]] = {}
+        frame_ids: Dict[Tuple[Optional[str], CodeType, int], str] = {}
+        samples = []
+        for ts, tid, stack in self.samples:
+            parent: Optional[str] = None
+            for code, line in stack:
+                key = (parent, code, line)
+                if key not in frame_ids:
+                    frame_ids[key] = str(len(frame_ids))
+                    name = f"{code.co_name} ({code.co_filename}:{line})"
+                    frames[frame_ids[key]] = {"name": name, "category": "python"}
+                    if parent is not None:
+                        frames[frame_ids[key]]["parent"] = parent
+                parent = frame_ids[key]
+            if parent is not None:
+                samples.append({"name": "sample", "ts": ts, "pid": 1, "tid": tid, "sf": parent, "weight": 1})
+
+        meta = [
+            {"ph": "M", "name": "thread_name", "pid": 1, "tid": tid, "args": {"name": name}}
+            for tid, name in threads.items()
+        ]
+        meta.append({"ph": "M", "name": "process_name", "pid": 1, "args": {"name": self.name}})
+        return {
+            "traceEvents": meta + events,
+            "stackFrames": frames,
+            "samples": samples,
+            "displayTimeUnit": "ms",
+            "otherData": {"request_id": self.request_id, "samples_truncated": len(self.samples) >= MAX_SAMPLES},
+        }
+
+
+class Span:
+    """Complete ("X") trace event around a block; extra args can be attached with `set`."""
+
+    __slots__ = ("trace", "name", "cat", "args", "start")
+
+    def __init__(self, trace: Trace, name: str, cat: str, args: Dict[str, Any]) -> None:
+        self.trace = trace
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = 0.0
+
+    def set(self, key: str, value: Any) -> None:
+        self.args[key] = value
+
+    def __enter__(self) -> "Span":
+        self.trace.enter()
+        self.start = self.trace.now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.trace.leave()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.trace.add({
+            "name": self.name, "cat": self.cat, "ph": "X",
+            "ts": self.start, "dur": self.trace.now_us() - self.start, "args": self.args,
+        })
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def traced(name: str, cat: str, **args: Any):
+    """Record the enclosed block in the active trace, if any."""
+    trace = _current.get()
+    if trace is None:
+        return _NO_SPAN
+    return Span(trace, name, cat, args)
+
+
+def propagate(fn: Callable[..., T]) -> Callable[..., T]:
+    """
+    Make `fn` run inside the active trace when submitted to a thread pool,
+    recording each call as a work item. Returns `fn` unchanged when tracing is off.
+    """
+    if _current.get() is None:
+        return fn
+    ctx = copy_context()
+
+    def work_item(*args: Any, **kwargs: Any) -> T:
+        def run() -> T:
+            with traced(getattr(fn, "__name__", "work item"), "pool"):
+                return fn(*args, **kwargs)
+        # each call gets its own copy, a Context can't be entered by two threads at once
+        return ctx.copy().run(run)
+
+    return work_item
+
+
+# --- per-request lifecycle and storage ---
+
+_store: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_store_lock = threading.Lock()
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def start_trace(request_id: str, name: str) -> Trace:
+    """Bind a new trace to the current context and start its profiler."""
+    trace = Trace(request_id, name)
+    _current.set(trace)
+    trace.enter()  # the thread serving the request (the event loop)
+    trace.start()
+    return trace
+
+
+def finish_trace(trace: Trace) -> None:
+    """Stop profiling, unbind the trace and keep its export for download."""
+    trace.stop()
+    trace.leave()
+    if _current.get() is trace:
+        _current.set(None)
+    exported = trace.to_chrome()
+    with _store_lock:
+        _store[trace.request_id] = exported
+        while len(_store) > MAX_STORED_TRACES:
+            _store.popitem(last=False)
+
+
+def get_trace(request_id: str) -> Optional[Dict[str, Any]]:
+    with _store_lock:
+        return _store.get(request_id)
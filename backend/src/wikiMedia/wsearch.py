@@ -1,16 +1,15 @@
 from typing import Optional, List, Any, Tuple
-from dataclasses import dataclass
 import aiohttp
+import os
 from functools import reduce
+from urllib.parse import urlparse
 
+from ..metrics import span
+from ..tracing import traced
+from ..resource import Resource
+from ..policy import acall, RETRYABLE_STATUS
 
-@dataclass(frozen=True)
-class WikiResult:
-    title: str
-    url: str
-
-
-API_BASE = "https://en.wikipedia.org/w/api.php"
+API_BASE = os.getenv("WIKIPEDIA_API", "https://en.wikipedia.org/w/api.php")  # see backend/loadtest/stubs.py
 
 
 def search_params(term: str) -> dict:
@@ -55,15 +54,29 @@ def mk_url(pageid: int) -> str:
     return f"https://en.wikipedia.org/?curid={pageid}"
 
 
+def transient(e: BaseException) -> bool:
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status in RETRYABLE_STATUS
+    return isinstance(e, aiohttp.ClientConnectionError)
+
+
 async def call_api(params: dict) -> dict:
-    """Make API call with given params."""
+    """Make API call with given params, under the "wiki" request policy."""
     headers = {"User-Agent": "WikipediaSearch/1.0"}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(API_BASE, params=params, headers=headers) as response:
-            return await response.json()
+
+    async def attempt(timeout: float) -> dict:
+        with traced("GET", "http", host=urlparse(API_BASE).hostname) as sp:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+                async with session.get(API_BASE, params=params, headers=headers) as response:
+                    sp.set("status", response.status)
+                    response.raise_for_status()
+                    return await response.json()
+
+    with span("wiki", "upstream"):
+        return await acall("wiki", attempt, transient)
 
 
-async def wikipedia_search(search_term: str) -> Optional[WikiResult]:
+async def wikipedia_search(search_term: str) -> Optional[Resource]:
     """Search Wikipedia and return result."""
     obj = await call_api(search_params(search_term))
     
@@ -71,7 +84,7 @@ async def wikipedia_search(search_term: str) -> Optional[WikiResult]:
     if page_info:
         pageid, title = page_info
 
-        return WikiResult(title, mk_url(pageid))
+        return Resource("wiki", title, mk_url(pageid))
     
     # Try suggestion:
     # usually, it's used when the user insert a typo in the search term
@@ -85,7 +98,7 @@ async def wikipedia_search(search_term: str) -> Optional[WikiResult]:
     if page_info:
         pageid, title = page_info
 
-        return WikiResult(title, mk_url(pageid))
+        return Resource("wiki", title, mk_url(pageid))
     
     return None
 
@@ -1,6 +1,55 @@
 import rio
 import httpx
-import ast
+import json
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import suppress
+
+
+SEARCH_URL = "http://localhost:8000/search"
+PAGE_SIZE = 20           # cards rendered per source before "Show more"
+REFRESH_INTERVAL = 0.1   # seconds: at most one UI refresh per frame budget while streaming
+DEBOUNCE = 0.35          # seconds of typing inactivity before searching
+MIN_QUERY_LENGTH = 3     # search-as-you-type ignores shorter queries
+CACHE_TTL = 120          # seconds a completed search is served from the client cache
+CACHE_SIZE = 32
+# PROPERLY_FAST_MODE=1: show HN/Reddit results before their links are checked, then patch them
+FAST_MODE = os.getenv("PROPERLY_FAST_MODE") == "1"
+
+Entry = tuple[str, str, str, bool]  # (title, link, description, verified)
+Results = dict[str, list[Entry]]    # source -> entries
+
+
+# One client for the whole app, so connections to the backend are reused across searches
+_client: httpx.AsyncClient | None = None
+
+def http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=5))
+    return _client
+
+
+# Short-lived cache of completed searches: editing back and forth is instant
+_cache: OrderedDict[str, tuple[float, Results]] = OrderedDict()
+
+def cache_key(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def cache_get(query: str) -> Results | None:
+    entry = _cache.get(cache_key(query))
+    if entry is None or time.monotonic() - entry[0] > CACHE_TTL:
+        return None
+    _cache.move_to_end(cache_key(query))
+    return entry[1]
+
+def cache_put(query: str, results: Results) -> None:
+    _cache[cache_key(query)] = (time.monotonic(), results)
+    _cache.move_to_end(cache_key(query))
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
 
 
 # Result card component
@@ -9,6 +58,7 @@ class Resource(rio.Component):
     link: str
     description: str
     source: str
+    verified: bool = True
     
     def build(self) -> rio.Component:
         return rio.Card(
@@ -33,6 +83,9 @@ class Resource(rio.Component):
                     font_size=1,
                     justify="center"
                 ),
+                rio.Text(
+                    "Checking link...", style="dim", italic=True, font_size=0.8, justify="center"
+                ) if not self.verified else rio.Spacer(grow_y=False),
                 spacing=0.5,
                 margin=1.5,
             ),
@@ -41,50 +94,179 @@ class Resource(rio.Component):
         )
 
 
+# Results of one source, paginated so that long lists stay cheap to render
+class ResultGroup(rio.Component):
+    source: str
+    results: list[Entry]
+    visible: int = PAGE_SIZE
+
+    def show_more(self) -> None:
+        self.visible += PAGE_SIZE
+
+    def build(self) -> rio.Component:
+        hidden = len(self.results) - self.visible
+        return rio.Column(
+            rio.Text(
+                f"{self.source} ({len(self.results)})",
+                style="heading3",
+                justify="left",
+            ),
+            *[
+                # keyed by link (unique per source): already rendered cards are reconciled, not rebuilt
+                Resource(
+                    title=title,
+                    link=link,
+                    description=descr,
+                    source=self.source,
+                    verified=verified,
+                    key=link,
+                )
+                for title, link, descr, verified in self.results[:self.visible]
+            ],
+            rio.Button(
+                f"Show {min(hidden, PAGE_SIZE)} more of {hidden}",
+                on_press=self.show_more,
+                shape="rounded",
+                style="minor",
+            ) if hidden > 0 else rio.Spacer(grow_y=False),
+            spacing=1,
+        )
+
+
 # Main search component
 class Properly(rio.Component):
     query: str = "" 
-    results: list[tuple[str, str, str, str]] = []
+    results: Results = {}
     is_searching: bool = False
-    
+    degraded: list[str] = []   # sources the backend skipped because they are failing
+    error: str = ""            # the last search failed (e.g. the backend is unreachable)
+
+    def __post_init__(self) -> None:
+        # plain attributes, not state: changing them must not trigger a rebuild
+        self._search_task: asyncio.Task | None = None
+        self._debounce_task: asyncio.Task | None = None
+
+    def on_query_change(self, event: rio.TextInputChangeEvent) -> None:
+        """Search as you type: restart the debounce timer on every edit."""
+        if self._debounce_task:
+            self._debounce_task.cancel()
+        if len(event.text.strip()) < MIN_QUERY_LENGTH:
+            return
+
+        async def debounced() -> None:
+            await asyncio.sleep(DEBOUNCE)
+            await self.search()
+
+        self._debounce_task = asyncio.create_task(debounced())
+
     async def search(self) -> None:
-        """Performing GET request and collect the results asynchronously"""
-        
+        """Start a search for the current query, cancelling the one in flight."""
+        if self._debounce_task and self._debounce_task is not asyncio.current_task():
+            self._debounce_task.cancel()
+        if self._search_task:
+            # closing the stream disconnects from the backend, which stops its work
+            self._search_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._search_task
+            self._search_task = None
+
         if not self.query.strip(): return
+        task = asyncio.create_task(self._search(self.query))
+        self._search_task = task
+        with suppress(asyncio.CancelledError):
+            await task
+
+    async def _search(self, query: str) -> None:
+        """Performing GET request and collect the results asynchronously"""
+        if (cached := cache_get(query)) is not None:
+            self.results = cached
+            self.degraded = []
+            self.error = ""
+            self.force_refresh()
+            return
+
         self.is_searching = True
-        self.results = []
+        self.results = {}
+        self.degraded = []
+        self.error = ""
         self.force_refresh() # Force UI update before starting search
-        
+
+        # Batches only mark the view as stale, a ticker refreshes at most once
+        # per REFRESH_INTERVAL no matter how fast resources stream in.
+        stale = asyncio.Event()
+
+        async def refresher() -> None:
+            while True:
+                await stale.wait()
+                stale.clear()
+                self.force_refresh()
+                await asyncio.sleep(REFRESH_INTERVAL)
+
+        ticker = asyncio.create_task(refresher())
         try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                url = f"http://localhost:8000/search?query={self.query}"
-                async with client.stream("GET", url) as response:
-                    async for line in response.aiter_lines():
-                        if not line.strip():
+            params = {"query": query, "fast": "true"} if FAST_MODE else {"query": query}
+            async with http_client().stream("GET", SEARCH_URL, params=params) as response:
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    try:
+                        item = json.loads(line)
+                        source = item["source"]
+
+                        if item.get("type") == "update":
+                            self.apply_updates(source, item["updates"])
+                            stale.set()
                             continue
-                        try:
-                            item = ast.literal_eval(line)
-                            source = item["source"]
-                            resources = item["resources"]
-                            
-                            # Process and append results
-                            new_results = [
-                                (parts[0].strip(), parts[1].strip(), parts[2].strip(), source)
-                                for entry in resources
-                                for parts in [entry.split("\n")]
-                                if len(parts) >= 3
-                            ]
-                            
-                            self.results.extend(new_results)
-                            self.force_refresh()  # Update UI after each batch
-                            
-                        except Exception:
+                        if item.get("type") == "degraded":
+                            self.degraded.append(source)
+                            stale.set()
                             continue
+
+                        # Process and append results, once per link (e.g. Reddit cross-posts repeat them)
+                        current = self.results.get(source, [])
+                        seen = {link for _, link, _, _ in current}
+                        new_results: list[Entry] = []
+                        for r in item["resources"]:
+                            if r["url"] in seen:
+                                continue
+                            seen.add(r["url"])
+                            new_results.append((
+                                r["title"] or "(No title)",
+                                r["url"],
+                                r["description"] or "(No description)",
+                                r["verified"],
+                            ))
+
+                        # a new list: rio only rebuilds a ResultGroup whose results changed identity
+                        self.results[source] = [*current, *new_results]
+                        stale.set()
+                        
+                    except Exception:
+                        continue
+            if not self.degraded:
+                # partial results are not worth keeping
+                cache_put(query, self.results)
+        except httpx.HTTPError as e:
+            # searches run as fire-and-forget tasks (search as you type): nobody else would handle it
+            self.error = f"Search failed: {type(e).__name__}"
         finally:
+            ticker.cancel()
             self.is_searching = False
             self.force_refresh()
             
 
+    def apply_updates(self, source: str, updates: list[dict]) -> None:
+        """Patch streamed (unverified) results in place: drop dead links, fill in descriptions."""
+        patches = {u["url"]: u for u in updates}
+        patched: list[Entry] = []
+        for title, link, descr, verified in self.results.get(source, []):
+            patch = patches.get(link)
+            if patch is None:
+                patched.append((title, link, descr, verified))
+            elif patch["live"]:
+                patched.append((title, link, patch["description"] or descr, True))
+        self.results[source] = patched
+
     def build(self) -> rio.Component:
         return rio.Column(
 
@@ -106,7 +288,9 @@ class Properly(rio.Component):
                     rio.TextInput(
                         text=self.bind().query,
                         label="Type a topic here!", # TODO: can we make this disappear after the user starts typing?
+                        on_change=self.on_query_change,
                         on_confirm=lambda _: self.search(),
+                        change_delay=0.1,
                         grow_x=True,
                         min_width=30,
                         style="rounded",
@@ -134,19 +318,32 @@ class Properly(rio.Component):
                 margin_top=2,
             ),
             
+            rio.Text(
+                f"Unavailable right now: {', '.join(self.degraded)}",
+                style="dim",
+                italic=True,
+                justify="center",
+            ) if self.degraded else rio.Spacer(grow_y=False),
+
+            rio.Text(
+                self.error,
+                style="dim",
+                italic=True,
+                justify="center",
+            ) if self.error else rio.Spacer(grow_y=False),
+
             # Results section (70% of the page)
             rio.ScrollContainer(
                 rio.Column(
                     *[
-                        Resource(
-                            title=title,
-                            link=link,
-                            description=descr,
+                        ResultGroup(
                             source=source,
+                            results=results,
+                            key=source,
                         )
-                        for title, link, descr, source in self.results
+                        for source, results in self.results.items()
                     ],
-                    spacing=1,
+                    spacing=2,
                 ) if self.results else rio.Text(
                     "Searching..." if self.is_searching else "No results yet",
                     style="dim",